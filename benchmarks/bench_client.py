@@ -0,0 +1,178 @@
+#! /usr/bin/env python
+""" Benchmark of the client side overhead of pyflix2, run against the local stand-in server of
+:py:mod:`pyflix2.fakeserver` so that no network access nor credentials are needed. For every scenario
+it measures the throughput, the latency percentiles, the memory allocated and the peak memory, and
+writes the results as json so that they can be compared between runs
+
+    $ python benchmarks/bench_client.py [-n iterations] [-s scenario ...] [-o results.json]
+
+The server runs in a child process by default, so that it doesn't compete with the client for the GIL.
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import timeit
+import platform
+import argparse
+import resource
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from pyflix2 import NetflixAPIV2
+from pyflix2.pyflix2 import __version__
+from pyflix2.fakeserver import FakeNetflixServer
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def serve(titles, ready, stop):
+    """ Runs the stand-in server until ``stop`` is set, sending its url through ``ready``"""
+    server = FakeNetflixServer(titles=titles).start()
+    ready.send(server.base_url)
+    stop.wait()
+    server.stop()
+
+
+def scenarios(netflix, user, title_ids):
+    """ Returns the ``(name, func, ops)`` benchmarked, ``ops`` being the number of items a call handles"""
+    counter = [0]
+
+    def get_title():
+        counter[0] += 1
+        return netflix.get_title(title_ids[counter[0] % len(title_ids)])
+
+    def get_catalog():
+        return sum(1 for _ in netflix.get_catalog(parse=True, chunk_size=64 * 1024))
+
+    return [('search_titles', lambda: netflix.search_titles('matrix', max_results=25), 1),
+            ('get_title', get_title, 1),
+            ('user.get_details', user.get_details, 1),
+            ('user.get_queues_instant', lambda: user.get_queues_instant(max_results=50), 1),
+            ('user.get_rating', lambda: user.get_rating(title_ids[:25]), 1),
+            ('get_catalog', get_catalog, None)]
+
+
+def percentile(values, q):
+    """ Nearest rank percentile of the sorted list ``values``"""
+    rank = max(int(round(q / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def measure(func, iterations, warmup):
+    """ Times ``iterations`` calls of ``func``, then measures the memory of a few more calls"""
+    for _ in range(warmup):
+        func()
+    latencies = []
+    gc.collect()
+    started = timeit.default_timer()
+    for _ in range(iterations):
+        call_started = timeit.default_timer()
+        result = func()
+        latencies.append(timeit.default_timer() - call_started)
+    elapsed = timeit.default_timer() - started
+
+    # Memory is measured on a separate pass, tracing allocations slows the calls down
+    memory_iterations = max(iterations // 10, 1)
+    gc.collect()
+    gc.disable()
+    try:
+        objects = len(gc.get_objects())
+        if tracemalloc is not None:
+            tracemalloc.start()
+        for _ in range(memory_iterations):
+            func()
+        gc.collect()
+        memory = {'retained_objects_per_call': float(len(gc.get_objects()) - objects) / memory_iterations}
+        if tracemalloc is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            memory['traced_bytes_per_call'] = float(current) / memory_iterations
+            memory['traced_peak_bytes'] = peak
+    finally:
+        gc.enable()
+    memory['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies.sort()
+    stats = {'iterations': iterations,
+             'elapsed': elapsed,
+             'throughput': iterations / elapsed,
+             'latency': dict([('mean', elapsed / iterations), ('min', latencies[0]), ('max', latencies[-1])] +
+                             [('p%d' % q, percentile(latencies, q)) for q in PERCENTILES]),
+             'memory': memory}
+    return stats, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pyflix2 against a local stand-in netflix server')
+    parser.add_argument('-n', '--iterations', type=int, default=200, help='calls timed per scenario')
+    parser.add_argument('-w', '--warmup', type=int, default=10, help='untimed calls made before timing')
+    parser.add_argument('-t', '--titles', type=int, default=5000, help='number of titles in the catalog')
+    parser.add_argument('-s', '--scenario', action='append', help='scenario to run (default: all), repeatable')
+    parser.add_argument('-o', '--output', help='file to write the json results to (default: stdout)')
+    parser.add_argument('--in-process', action='store_true', help='run the server in the benchmark process')
+    args = parser.parse_args()
+
+    if args.in_process:
+        server = FakeNetflixServer(titles=args.titles).start()
+        base_url = server.base_url
+    else:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        stop = multiprocessing.Event()
+        server = multiprocessing.Process(target=serve, args=(args.titles, sender, stop))
+        server.daemon = True
+        server.start()
+        base_url = receiver.recv()
+
+    netflix = NetflixAPIV2('pyflix2-bench', 'consumer_key', 'consumer_secret', base_url=base_url)
+    user = netflix.get_user('T1bench', 'access_token', 'access_token_secret')
+    title_ids = ['%s/catalog/titles/movies/%d' % (base_url, 70000000 + n) for n in range(min(args.titles, 100))]
+
+    results = {}
+    try:
+        for name, func, ops in scenarios(netflix, user, title_ids):
+            if args.scenario and name not in args.scenario:
+                continue
+            # A catalog download is a much longer call than the others
+            iterations = max(args.iterations // 50, 3) if ops is None else args.iterations
+            stats, result = measure(func, iterations, min(args.warmup, iterations))
+            if ops is None:
+                stats['items_per_call'] = result
+                stats['items_per_second'] = result * stats['throughput']
+            results[name] = stats
+            print >> sys.stderr, '%-25s %9.1f calls/s  p50 %7.2f ms  p99 %7.2f ms  %6.1f retained objects/call' % (
+                name, stats['throughput'], stats['latency']['p50'] * 1e3, stats['latency']['p99'] * 1e3,
+                stats['memory']['retained_objects_per_call'])
+    finally:
+        if args.in_process:
+            server.stop()
+        else:
+            stop.set()
+            server.join()
+
+    report = {'meta': {'pyflix2': __version__,
+                       'python': platform.python_version(),
+                       'implementation': platform.python_implementation(),
+                       'platform': platform.platform(),
+                       'timestamp': time.time(),
+                       'titles': args.titles,
+                       'server': 'in-process' if args.in_process else 'subprocess'},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+#! /usr/bin/env python
+""" Micro benchmark of signing a user request with a freshly built ``OAuth1`` signer (what ``User`` used to do)
+against the cached signer of :py:func:`pyflix2.signing.get_signer`
+
+    $ python benchmarks/bench_signing.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+from requests_oauthlib import OAuth1
+from pyflix2.signing import get_signer
+
+URL = 'http://api-public.netflix.com/users/T1tf/ratings/title'
+PARAMS = {'title_refs': ','.join('http://api.netflix.com/catalog/titles/movies/%d' % i for i in range(25)),
+          'output': 'json', 'v': '2.0'}
+CREDENTIALS = ('consumer_key', 'consumer_secret', 'access_token', 'access_token_secret')
+REQUEST = requests.Request('GET', URL, params=PARAMS).prepare()
+
+
+def sign_fresh():
+    request = REQUEST.copy()
+    oauth = OAuth1(CREDENTIALS[0], client_secret=CREDENTIALS[1], resource_owner_key=CREDENTIALS[2],
+                   resource_owner_secret=CREDENTIALS[3], signature_type='query')
+    return oauth(request)
+
+
+def sign_cached():
+    request = REQUEST.copy()
+    return get_signer(*CREDENTIALS, signature_type='query')(request)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for name, func in (('fresh OAuth1', sign_fresh), ('cached signer', sign_cached)):
+        best = min(timeit.repeat(func, number=iterations, repeat=3))
+        print '%-15s %8.1f us/request' % (name, best / iterations * 1e6)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,9 @@ __author__ = 'Arup Malakar'
 __license__ = 'BSD'
 __copyright__ = 'Copyright 2012 Arup Malakar'
 
-from pyflix2 import NetflixAPIV2, NetflixAPIV1, User, NetflixError, EXPANDS, SORT_ORDER, RENTAL_HISTORY_TYPE
+from pyflix2 import NetflixAPIV2, NetflixAPIV1, User, NetflixError, RateLimitError, CircuitOpenError, \
+    DeadlineExceededError, ReplayMissError, EXPANDS, SORT_ORDER, RENTAL_HISTORY_TYPE
+from asyncclient import AsyncNetflixAPIV2, AsyncUser
 
 
 def main():
@@ -0,0 +1,109 @@
+""" Non blocking variants of :py:class:`~pyflix2.NetflixAPIV2` and :py:class:`~pyflix2.User`
+
+Every api call returns immediately with a result object (``multiprocessing.pool.AsyncResult``),
+the request itself is made on a bounded pool of worker threads sharing the pooled connections
+of the client::
+
+    netflix = AsyncNetflixAPIV2('appname', 'key', 'shared_secret', max_workers=50)
+    pending = [netflix.get_title(id) for id in title_ids]
+    titles = [result.get() for result in pending]
+"""
+
+from multiprocessing.pool import ThreadPool
+
+from pyflix2 import NetflixAPIV2, _current_deadline, _deadline_scope
+
+
+class _AsyncProxy(object):
+    """ Exposes the request methods of ``target`` (listed in ``_async_methods``) so that they run on
+    ``pool``, the other attributes are those of ``target``: the ``iter_*`` generators, which make their
+    requests as they are iterated, and ``get_catalog`` run on the calling thread"""
+
+    _async_methods = frozenset()
+
+    def __init__(self, target, pool):
+        self._target = target
+        self._pool = pool
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name not in self._async_methods:
+            return attr
+
+        def run(expires, args, kwargs):
+            with _deadline_scope(expires):
+                return attr(*args, **kwargs)
+
+        def call(*args, **kwargs):
+            # The deadline of the calling thread applies to the call made on the worker
+            return self._pool.apply_async(run, (_current_deadline(), args, kwargs))
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
+
+    def deadline(self, seconds):
+        """ Returns the context manager bounding the time of the calls made within it, see
+        :py:meth:`~pyflix2.NetflixAPIV2.deadline`. The deadline applies to the calls started
+        within the block, even though they complete on the workers::
+
+            with netflix.deadline(2.5):
+                pending = [netflix.get_title(id) for id in title_ids]
+            titles = [result.get() for result in pending]
+        """
+        return self._target.deadline(seconds)
+
+
+class AsyncNetflixAPIV2(_AsyncProxy):
+    """ Non blocking :py:class:`~pyflix2.NetflixAPIV2`, has the same methods but each of them returns
+    an ``AsyncResult`` at once; call ``get([timeout])`` on it to wait for the response (or the error)"""
+
+    _async_methods = frozenset(['get_request_token', 'get_access_token', 'search_titles', 'title_autocomplete',
+                                'get_title', 'get_titles', 'search_people', 'get_person', 'get_people',
+                                'get_movie_by_title', 'download_catalog', 'sync_catalog'])
+
+    def __init__(self, appname, consumer_key, consumer_secret, max_workers=10, **kwargs):
+        """
+        :param appname: The Application name as registered in Netflix Developer
+            website <http://developer.netflix.com/apps/mykeys>
+        :param consumer_key: The consumer key as registered in Netlflix Developer website
+        :param consumer_secret: The consumer secret as registerde in Netflix Developer website
+        :param max_workers: (Optional) The maximum number of requests in flight at a time
+        :param kwargs: (Optional) Other arguments of :py:class:`~pyflix2.NetflixAPIV2`, unless given
+            ``pool_maxsize`` is set to ``max_workers`` so that each worker can keep its connection open
+        """
+        kwargs.setdefault('pool_maxsize', max_workers)
+        netflix = NetflixAPIV2(appname, consumer_key, consumer_secret, **kwargs)
+        super(AsyncNetflixAPIV2, self).__init__(netflix, ThreadPool(max_workers))
+
+    def get_user(self, user_id, user_token, user_token_secret):
+        """ Returns the :py:class:`AsyncUser`, which shares the worker pool of this client
+
+        :param user_id: The user id as received using the ``get_access_token()`` method
+        :param user_token: The user token as received using the ``get_access_token()`` method
+        :param user_token_secret: The user token secret as received using the ``get_user_token()`` method
+        """
+        user = self._target.get_user(user_id, user_token, user_token_secret)
+        return AsyncUser(user, self._pool)
+
+    def close(self):
+        """ Waits for the pending requests to complete and stops the worker threads"""
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncUser(_AsyncProxy):
+    """ Non blocking :py:class:`~pyflix2.User`, don't create it directly use
+    :py:meth:`AsyncNetflixAPIV2.get_user` instead"""
+
+    _async_methods = frozenset(['get_details', 'get_feeds', 'get_title_states', 'get_queues', 'get_queues_instant',
+                                'get_queues_disc', 'add_queue_instant', 'get_resource',
+                                'get_queues_instant_available', 'delete_queues_instant_available',
+                                'get_queues_instant_saved', 'delete_queue_instant_saved', 'get_rental_history',
+                                'get_rating', 'get_actual_rating', 'add_my_rating', 'get_my_rating',
+                                'update_my_rating', 'get_predicted_ratings', 'get_recommendations'])
@@ -0,0 +1,349 @@
+""" Response caches for the catalog requests made by the netflix client
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import errno
+import base64
+import hashlib
+import threading
+import urllib
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+_MAX_AGE_RE = re.compile(r'max-age\s*=\s*(\d+)')
+_NO_CACHE_DIRECTIVES = ('no-store', 'no-cache', 'private')
+
+
+def cache_key(method, url, params):
+    """ Returns the key a request is cached under: the method, url and the sorted parameters"""
+    query = urllib.urlencode(sorted((k, unicode(v).encode('utf-8')) for k, v in params.items()))
+    return '%s %s?%s' % (method.upper(), url, query)
+
+
+def cache_ttl(response, default_ttl):
+    """ Returns for how many seconds ``response`` may be cached as per its ``Cache-Control`` header,
+    ``default_ttl`` if it has none. Returns 0 if the response must not be cached"""
+    cache_control = response.headers.get('Cache-Control', '').lower()
+    if any(directive in cache_control for directive in _NO_CACHE_DIRECTIVES):
+        return 0
+    match = _MAX_AGE_RE.search(cache_control)
+    if match:
+        return int(match.group(1))
+    return default_ttl
+
+
+def to_entry(response):
+    """ Converts a ``requests.Response`` to the ``dict`` stored in the caches"""
+    return {'status': response.status_code, 'url': response.url, 'headers': dict(response.headers),
+            'encoding': response.encoding, 'content': response.content}
+
+
+def to_response(entry):
+    """ Rebuilds the ``requests.Response`` from an entry created with :py:func:`to_entry`"""
+    response = requests.models.Response()
+    response.status_code = entry['status']
+    response.url = entry['url']
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response.encoding = entry['encoding']
+    response._content = entry['content']
+    return response
+
+
+class BaseCache(object):
+    """ Base class of the response caches, keeping count of hits, misses and evictions.
+
+    Any object with the methods ``get(key)`` and ``set(key, entry, ttl)`` can be used as cache
+    by the client, subclasses of this class only need to implement ``_load``, ``_store`` and ``_delete``.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def stats(self):
+        """ ``dict`` of the number of hits, hits on expired entries (see ``max_stale`` of :py:meth:`get`),
+        misses and evictions"""
+        return {'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+    def get(self, key, max_stale=0):
+        """ Returns the entry cached under ``key``, ``None`` if there is none or it has expired
+
+        :param key: The key of the entry
+        :param max_stale: (Optional) The number of seconds an expired entry is still returned for,
+            callers can tell it is stale by its ``expires`` time being past
+        """
+        entry = self._load(key)
+        now = time.time()
+        if entry is not None and entry['expires'] + max_stale <= now:
+            self._delete(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+        elif entry['expires'] <= now:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def set(self, key, entry, ttl):
+        """ Caches ``entry`` under ``key`` for ``ttl`` seconds"""
+        entry = dict(entry, expires=time.time() + ttl)
+        self._store(key, entry)
+
+    def _load(self, key):
+        raise NotImplementedError
+
+    def _store(self, key, entry):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+
+class MemoryCache(BaseCache):
+    """ In memory cache holding upto ``max_entries`` responses, the least recently used
+    response is evicted to make room for a new one"""
+
+    def __init__(self, max_entries=1000):
+        """
+        :param max_entries: (Optional) The maximum number of responses kept
+        """
+        super(MemoryCache, self).__init__()
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DiskCache(BaseCache):
+    """ Cache keeping the responses on disk under ``directory``, so that a restarted process starts
+    with the responses fetched by the previous one::
+
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', cache=DiskCache('~/.pyflix2/cache'))
+
+    Each response is stored as a zlib compressed json blob. The index of the blobs (their size,
+    expiry and recency) is an append only journal, compacted when the cache is opened or closed.
+    Blobs are fully written (and with ``fsync`` set, synced) before the journal refers to them, so
+    a crash loses at most the responses being written. The least recently used responses are evicted
+    to keep the cache within ``max_entries`` responses and ``max_size`` bytes.
+    """
+
+    INDEX = 'index.jsonl'
+    """ The name of the index journal in ``directory``"""
+
+    def __init__(self, directory, max_entries=10000, max_size=256 * 1024 * 1024, fsync=True):
+        """
+        :param directory: The directory to keep the responses in, it is created if needed
+        :param max_entries: (Optional) The maximum number of responses kept
+        :param max_size: (Optional) The maximum number of bytes taken by the (compressed) responses
+        :param fsync: (Optional) If unset writes are not synced to disk, which is faster but
+            responses written just before a crash may be lost
+        """
+        super(DiskCache, self).__init__()
+        self.directory = os.path.expanduser(directory)
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # blob name -> (size, expires), in the order of last use
+        self._entries = OrderedDict()
+        self._size = 0
+        self._journal = None
+        self._journal_lines = 0
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with self._lock:
+            self._open()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """ The number of bytes taken by the cached responses"""
+        return self._size
+
+    def _name(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return hashlib.sha1(key).hexdigest() + _BLOB_SUFFIX
+
+    def _load(self, key):
+        name = self._name(key)
+        with self._lock:
+            meta = self._entries.pop(name, None)
+            if meta is None:
+                return None
+            self._entries[name] = meta
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                record = json.loads(zlib.decompress(f.read()))
+        except (IOError, ValueError, zlib.error):
+            self._delete(key)
+            return None
+        if record.pop('key') != key:
+            return None
+        return _decode_entry(record)
+
+    def _store(self, key, entry):
+        name = self._name(key)
+        record = _encode_entry(entry)
+        record['key'] = key
+        blob = zlib.compress(json.dumps(record, separators=(',', ':')))
+        with self._lock:
+            _write_file(os.path.join(self.directory, name), blob, self.fsync)
+            self._forget(name)
+            self._entries[name] = (len(blob), entry['expires'])
+            self._size += len(blob)
+            self._log({'set': name, 'size': len(blob), 'expires': entry['expires']})
+            self._evict()
+            if self._journal_lines > 2 * len(self._entries) + 1000:
+                self._compact()
+
+    def _delete(self, key):
+        with self._lock:
+            self._remove(self._name(key))
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_size):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def close(self):
+        """ Compacts the index and closes it, the cache can't be used afterwards"""
+        with self._lock:
+            if self._journal is not None:
+                self._compact()
+                self._journal.close()
+                self._journal = None
+
+    def _open(self):
+        """ Replays the journal, drops the blobs it doesn't know of (or which are gone) and the temporary
+        files left by a crash, and compacts it"""
+        index_path = os.path.join(self.directory, self.INDEX)
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                        if 'set' in op:
+                            self._entries.pop(op['set'], None)
+                            self._entries[op['set']] = (op['size'], op['expires'])
+                        elif 'delete' in op:
+                            self._entries.pop(op['delete'], None)
+                    except (ValueError, KeyError, TypeError):
+                        # The last line may be torn by a crash
+                        continue
+        names = set(os.listdir(self.directory))
+        for name in list(self._entries):
+            if name not in names:
+                del self._entries[name]
+        for name in names - set(self._entries):
+            # Blobs written without their journal entry, and files a crash left half written
+            if name.endswith((_BLOB_SUFFIX, _BLOB_SUFFIX + _TMP_SUFFIX)) or name == self.INDEX + _TMP_SUFFIX:
+                _remove_file(os.path.join(self.directory, name))
+        self._size = sum(size for size, _ in self._entries.itervalues())
+        self._compact()
+        self._evict()
+
+    def _compact(self):
+        """ Rewrites the journal with only the current entries, in the order of their last use"""
+        if self._journal is not None:
+            self._journal.close()
+        lines = [json.dumps({'set': name, 'size': size, 'expires': expires}) + '\n'
+                 for name, (size, expires) in self._entries.iteritems()]
+        index_path = os.path.join(self.directory, self.INDEX)
+        _write_file(index_path, ''.join(lines), self.fsync)
+        self._journal = open(index_path, 'ab')
+        self._journal_lines = len(lines)
+
+    def _log(self, op):
+        self._journal.write(json.dumps(op) + '\n')
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal_lines += 1
+
+    def _forget(self, name):
+        meta = self._entries.pop(name, None)
+        if meta is not None:
+            self._size -= meta[0]
+        return meta
+
+    def _remove(self, name):
+        if self._forget(name) is not None:
+            self._log({'delete': name})
+        _remove_file(os.path.join(self.directory, name))
+
+
+_BLOB_SUFFIX = '.json.z'
+_TMP_SUFFIX = '.tmp'
+
+
+def _encode_entry(entry):
+    """ Returns the json serializable form of a cache entry, binary content is base64 encoded"""
+    record = dict(entry)
+    try:
+        record['content'] = entry['content'].decode('utf-8')
+    except UnicodeDecodeError:
+        record['content'] = base64.b64encode(entry['content'])
+        record['base64'] = True
+    return record
+
+
+def _decode_entry(record):
+    if record.pop('base64', False):
+        record['content'] = base64.b64decode(record['content'])
+    else:
+        record['content'] = record['content'].encode('utf-8')
+    return record
+
+
+def _write_file(path, data, fsync):
+    """ Replaces the file at ``path`` with ``data`` atomically"""
+    tmp_path = path + _TMP_SUFFIX
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.rename(tmp_path, path)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
@@ -0,0 +1,369 @@
+""" Helpers for consuming the full catalog stream returned by ``get_catalog()``
+"""
+
+import os
+import re
+import zlib
+import codecs
+import json
+import hashlib
+from collections import namedtuple
+from xml.etree import cElementTree as ElementTree
+
+GZIP_MAGIC = '\x1f\x8b'
+
+ADDED = 'added'
+MODIFIED = 'modified'
+REMOVED = 'removed'
+
+CatalogDelta = namedtuple('CatalogDelta', 'added modified removed')
+""" Result of :py:meth:`CatalogSnapshot.diff`: lists of added and modified title records and of removed title ids"""
+
+_WHITESPACE = u' \t\n\r'
+# Upto how many characters are read looking for the end of the first line of the catalog
+_MAX_LINE_LOOKAHEAD = 1024 * 1024
+# Matches the name of an object member upto the first character of its value
+_MEMBER_RE = re.compile(r'\s*"(?:[^"\\]|\\.)*"\s*:\s*(\S)')
+
+
+def iter_decompressed(chunks):
+    """ Yields the byte chunks of a catalog stream, gunzipping them on the fly if the stream
+    is gzip compressed. Streams which are not compressed are passed through as is.
+
+    :param chunks: iterable of byte strings, as returned by ``get_catalog()``
+    """
+    head = ''
+    decompressor = None
+    for chunk in chunks:
+        if decompressor is None:
+            head += chunk
+            if len(head) < len(GZIP_MAGIC):
+                continue
+            if head.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                decompressor = False
+            chunk = head
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+            # Catalog files may be made of several concatenated gzip members
+            while decompressor.unused_data:
+                unused = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                chunk += decompressor.decompress(unused)
+        if chunk:
+            yield chunk
+    if decompressor is None and head:
+        yield head
+    elif decompressor:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def iter_titles(chunks):
+    """ Incrementally parses a (optionally gzipped) catalog stream and yields one title record
+    at a time, so that memory usage stays flat irrespective of the size of the catalog.
+
+    Both the json catalog of V2 and the xml catalog of V1 are understood:
+
+        - json: a top level array of titles, an object wrapping the array of titles (the members
+          ahead of the array, such as ``number_of_results``, are skipped) or one title object per line
+        - xml: every child element of the document root is a title, it is converted to ``dict``
+
+    :param chunks: iterable of byte strings, as returned by ``get_catalog()``
+    :returns: generator of title records (``dict``)
+    """
+    chunks = iter_decompressed(chunks)
+    for chunk in chunks:
+        stripped = chunk.lstrip()
+        if not stripped:
+            continue
+        stream = _chain(chunk, chunks)
+        if stripped.startswith('<'):
+            return _iter_xml_titles(stream)
+        return iter(_JSONTitleStream(stream))
+    return iter([])
+
+
+def fingerprint(title):
+    """ Returns a compact (20 bytes) fingerprint of a title record, which changes whenever any
+    part of the record changes"""
+    return hashlib.sha1(json.dumps(title, sort_keys=True, separators=(',', ':'))).digest()
+
+
+class CatalogSnapshot(object):
+    """ Fingerprints of all the titles of a catalog keyed by title id, used to find out what changed
+    between two downloads of the catalog without keeping the previous catalog around::
+
+        previous = CatalogSnapshot.load('catalog.snapshot')
+        delta, current = previous.diff(netflix.get_catalog(parse=True))
+        current.save('catalog.snapshot')
+    """
+
+    def __init__(self, fingerprints=None):
+        """
+        :param fingerprints: (Optional) ``dict`` of title id to :py:func:`fingerprint` of the title
+        """
+        self.fingerprints = fingerprints if fingerprints is not None else {}
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def __contains__(self, title_id):
+        return title_id in self.fingerprints
+
+    @classmethod
+    def load(cls, path):
+        """ Loads a snapshot saved using :py:meth:`save`, an empty snapshot is returned if
+        ``path`` doesn't exist so that the first run reports every title as added"""
+        fingerprints = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    title_id, _, digest = line.rstrip('\n').rpartition('\t')
+                    fingerprints[title_id.decode('utf-8')] = digest.decode('hex')
+        return cls(fingerprints)
+
+    def save(self, path):
+        """ Saves the snapshot to ``path``, the file is replaced atomically"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for title_id, digest in self.fingerprints.iteritems():
+                f.write('%s\t%s\n' % (title_id.encode('utf-8'), digest.encode('hex')))
+        os.rename(tmp_path, path)
+
+    def update(self, titles):
+        """ Adds the fingerprints of ``titles`` to the snapshot"""
+        for title in titles:
+            self.fingerprints[title['id']] = fingerprint(title)
+
+    def iter_changes(self, titles, current=None):
+        """ Compares a catalog with this snapshot and yields the changes as they are found, memory
+        usage is proportional to the number of titles (not to the size of the catalog).
+
+        Yields ``(ADDED, title)`` and ``(MODIFIED, title)`` while going through ``titles``,
+        followed by ``(REMOVED, title_id)`` for titles no longer in the catalog.
+
+        :param titles: iterable of title records, e.g. ``get_catalog(parse=True)``
+        :param current: (Optional) :py:class:`CatalogSnapshot` which gets populated with the
+            fingerprints of ``titles``, to be saved for the next comparison
+        """
+        if current is None:
+            current = CatalogSnapshot()
+        previous = self.fingerprints
+        for title in titles:
+            title_id = title['id']
+            digest = fingerprint(title)
+            current.fingerprints[title_id] = digest
+            old_digest = previous.get(title_id)
+            if old_digest is None:
+                yield ADDED, title
+            elif old_digest != digest:
+                yield MODIFIED, title
+        for title_id in previous:
+            if title_id not in current.fingerprints:
+                yield REMOVED, title_id
+
+    def diff(self, titles):
+        """ Compares a catalog with this snapshot
+
+        :param titles: iterable of title records, e.g. ``get_catalog(parse=True)``
+        :returns: the tuple ``(delta, snapshot)`` where ``delta`` is a :py:data:`CatalogDelta`
+            and ``snapshot`` the :py:class:`CatalogSnapshot` of ``titles``
+        """
+        current = CatalogSnapshot()
+        delta = CatalogDelta([], [], [])
+        changes = {ADDED: delta.added, MODIFIED: delta.modified, REMOVED: delta.removed}
+        for change, item in self.iter_changes(titles, current):
+            changes[change].append(item)
+        return delta, current
+
+
+def _chain(first, rest):
+    yield first
+    for chunk in rest:
+        yield chunk
+
+
+class _JSONTitleStream(object):
+    """ Splits a json catalog into title records without loading the whole document"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = u''
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self):
+        c = self._peek()
+        if c == u'[':
+            self._pos += 1
+            return self._iter_array()
+        if c == u'{' and not self._is_line_delimited() and self._find_array_member():
+            return self._iter_array()
+        return self._iter_lines()
+
+    def _iter_array(self):
+        while True:
+            c = self._peek()
+            if c == u',':
+                self._pos += 1
+                continue
+            if c == u']' or c is None:
+                return
+            yield self._decode()
+
+    def _iter_lines(self):
+        while self._peek() is not None:
+            yield self._decode()
+
+    def _is_line_delimited(self):
+        """ Returns True if the first line of the stream is a complete json object on its own
+        and more lines follow it"""
+        while True:
+            end = self._buffer.find(u'\n', self._pos)
+            if end < 0 and len(self._buffer) - self._pos > _MAX_LINE_LOOKAHEAD:
+                return False
+            if end >= 0 or not self._fill():
+                break
+        if end < 0:
+            # The whole catalog is on one line, it can't be told apart from a wrapper object
+            return False
+        try:
+            return isinstance(json.loads(self._buffer[self._pos:end]), dict)
+        except ValueError:
+            return False
+
+    def _find_array_member(self):
+        """ Moves past ``{"key": [`` and returns True if the object at the current position wraps the
+        title array, i.e. has an array valued member. The members ahead of it (e.g. ``number_of_results``)
+        are skipped. Otherwise leaves the position untouched"""
+        # Offset from the current position, which _fill() moves
+        offset = 1
+        while True:
+            match = _MEMBER_RE.match(self._buffer, self._pos + offset)
+            if match is None:
+                rest = self._buffer[self._pos + offset:].lstrip(_WHITESPACE)
+                if rest and not rest.startswith(u'"'):
+                    # The end of the object, or not an object at all
+                    return False
+                if not self._fill():
+                    return False
+                continue
+            if match.group(1) == u'[':
+                self._pos = match.end()
+                return True
+            end = self._skip_value(match.end() - 1)
+            if end is None:
+                if not self._fill():
+                    return False
+                continue
+            offset = end - self._pos
+
+    def _skip_value(self, pos):
+        """ Returns the position following the value at ``pos`` and the comma after it, ``None`` if the
+        buffer doesn't hold all of it"""
+        try:
+            _, end = self._json.raw_decode(self._buffer, pos)
+        except ValueError:
+            return None
+        while end < len(self._buffer) and self._buffer[end] in _WHITESPACE:
+            end += 1
+        # A number at the end of the buffer may continue in the next chunk
+        if end == len(self._buffer):
+            return None
+        return end + 1 if self._buffer[end] == u',' else end
+
+    def _fill(self):
+        """ Appends the next chunk to the buffer, dropping what has already been consumed.
+        Returns False once the stream is exhausted"""
+        if self._eof:
+            return False
+        try:
+            data = self._decoder.decode(next(self._chunks))
+        except StopIteration:
+            self._eof = True
+            data = self._decoder.decode('', True)
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        return not self._eof or bool(data)
+
+    def _peek(self):
+        """ Returns the next non whitespace character, ``None`` at the end of the stream"""
+        while True:
+            buf = self._buffer
+            pos = self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return None
+
+    def _decode(self):
+        while True:
+            try:
+                record, end = self._json.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                # Most likely the record is split across chunks, read more and retry
+                if self._fill():
+                    continue
+                raise
+            self._pos = end
+            return record
+
+
+class _ChunkReader(object):
+    """ Minimal file like wrapper over an iterable of byte chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _iter_xml_titles(chunks):
+    depth = 0
+    root = None
+    for event, element in ElementTree.iterparse(_ChunkReader(chunks), events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            yield _element_to_dict(element)
+            root.clear()
+
+
+def _element_to_dict(element):
+    text = (element.text or u'').strip()
+    if not len(element) and not element.attrib:
+        return text
+    record = dict(element.attrib)
+    for child in element:
+        value = _element_to_dict(child)
+        if child.tag not in record:
+            record[child.tag] = value
+        elif isinstance(record[child.tag], list):
+            record[child.tag].append(value)
+        else:
+            record[child.tag] = [record[child.tag], value]
+    if text:
+        record['text'] = text
+    return record
@@ -0,0 +1,169 @@
+""" Circuit breaker failing requests fast while netflix is down, instead of letting each of them
+wait for its timeout
+"""
+
+import time
+import threading
+from collections import deque
+from urlparse import urlparse
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+FAMILIES = ('catalog', 'users', 'oauth')
+""" The endpoint families having a circuit of their own"""
+
+
+def endpoint_family(url):
+    """ Returns the family (one of :py:data:`FAMILIES`) of the endpoint ``url`` points to"""
+    path = urlparse(url).path
+    if path.startswith('/users'):
+        return 'users'
+    if path.startswith('/oauth'):
+        return 'oauth'
+    return 'catalog'
+
+
+class _Circuit(object):
+    """ State of the circuit of one endpoint family"""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.calls = deque()
+        self.opened_at = None
+        self.probes = 0
+
+
+class CircuitBreaker(object):
+    """ Tracks the error rate and latency of the recent requests of each endpoint family (catalog,
+    users and oauth) and *opens* the circuit of a family once too many of them fail or are slow::
+
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', circuit_breaker=CircuitBreaker())
+
+    While a circuit is open its requests fail at once with :py:class:`~pyflix2.CircuitOpenError`.
+    After ``reset_timeout`` seconds the circuit is *half open*: a few probe requests go through, and
+    the circuit closes again if they succeed or opens for another ``reset_timeout`` if they fail.
+
+    Connection errors, timeouts and 5xx responses are failures, other responses are successes
+    (a 404 means netflix is up). A breaker can be shared by several clients, it is thread safe.
+    """
+
+    def __init__(self, failure_rate=0.5, slow_call_rate=0.8, slow_call_duration=10, window=60,
+                 min_calls=10, reset_timeout=30, half_open_calls=1):
+        """
+        :param failure_rate: (Optional) The ratio of failed requests in the window which opens the circuit
+        :param slow_call_rate: (Optional) The ratio of requests slower than ``slow_call_duration``
+            which opens the circuit
+        :param slow_call_duration: (Optional) The number of seconds after which a request is slow,
+            ``None`` to ignore latency
+        :param window: (Optional) The number of seconds of requests the rates are computed over
+        :param min_calls: (Optional) The least number of requests in the window before the circuit can open
+        :param reset_timeout: (Optional) The number of seconds a circuit stays open before probing
+        :param half_open_calls: (Optional) The number of probe requests let through at a time while half open
+        """
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_duration = slow_call_duration
+        self.window = window
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._circuits = dict((family, _Circuit()) for family in FAMILIES)
+        self._lock = threading.Lock()
+
+    def state(self, family):
+        """ Returns the state of the circuit of ``family``: ``"closed"``, ``"open"`` or ``"half_open"``"""
+        with self._lock:
+            circuit = self._circuits[family]
+            self._update(circuit, time.time())
+            return circuit.state
+
+    @property
+    def stats(self):
+        """ ``dict`` of the state, the number of requests, failures and slow requests in the
+        window, per endpoint family"""
+        stats = {}
+        with self._lock:
+            now = time.time()
+            for family, circuit in self._circuits.iteritems():
+                self._update(circuit, now)
+                stats[family] = {'state': circuit.state, 'calls': len(circuit.calls),
+                                 'failures': sum(1 for _, failed, _ in circuit.calls if failed),
+                                 'slow': sum(1 for _, _, slow in circuit.calls if slow)}
+        return stats
+
+    def retry_in(self, family):
+        """ Returns the number of seconds until the open circuit of ``family`` lets a probe through"""
+        with self._lock:
+            circuit = self._circuits[family]
+            if circuit.state != OPEN:
+                return 0.0
+            return max(circuit.opened_at + self.reset_timeout - time.time(), 0.0)
+
+    def allow(self, family):
+        """ Returns True if a request of ``family`` may be made now. Every allowed request must be
+        followed by a call to :py:meth:`record` (or :py:meth:`cancel`)"""
+        with self._lock:
+            circuit = self._circuits[family]
+            self._update(circuit, time.time())
+            if circuit.state == CLOSED:
+                return True
+            if circuit.state == HALF_OPEN and circuit.probes < self.half_open_calls:
+                circuit.probes += 1
+                return True
+            return False
+
+    def record(self, family, failed, duration):
+        """ Records the outcome of a request allowed by :py:meth:`allow`
+
+        :param family: The endpoint family of the request
+        :param failed: True if the request failed
+        :param duration: The number of seconds the request took
+        """
+        slow = self.slow_call_duration is not None and duration >= self.slow_call_duration
+        with self._lock:
+            circuit = self._circuits[family]
+            now = time.time()
+            if circuit.state == HALF_OPEN:
+                circuit.probes = max(circuit.probes - 1, 0)
+                if failed or slow:
+                    self._open(circuit, now)
+                else:
+                    circuit.state = CLOSED
+                    circuit.calls.clear()
+                return
+            circuit.calls.append((now, failed, slow))
+            self._update(circuit, now)
+            if circuit.state == CLOSED and self._is_tripped(circuit):
+                self._open(circuit, now)
+
+    def cancel(self, family):
+        """ Forgets a request allowed by :py:meth:`allow` whose outcome says nothing about netflix,
+        e.g. one cut short by the deadline of the caller"""
+        with self._lock:
+            circuit = self._circuits[family]
+            if circuit.state == HALF_OPEN:
+                circuit.probes = max(circuit.probes - 1, 0)
+
+    def _update(self, circuit, now):
+        while circuit.calls and circuit.calls[0][0] < now - self.window:
+            circuit.calls.popleft()
+        if circuit.state == OPEN and now - circuit.opened_at >= self.reset_timeout:
+            circuit.state = HALF_OPEN
+            circuit.probes = 0
+
+    def _is_tripped(self, circuit):
+        calls = len(circuit.calls)
+        if calls < self.min_calls:
+            return False
+        failures = sum(1 for _, failed, _ in circuit.calls if failed)
+        slow = sum(1 for _, _, slow in circuit.calls if slow)
+        return (failures >= self.failure_rate * calls or
+                (self.slow_call_duration is not None and slow >= self.slow_call_rate * calls))
+
+    def _open(self, circuit, now):
+        circuit.state = OPEN
+        circuit.opened_at = now
+        circuit.probes = 0
+        circuit.calls.clear()
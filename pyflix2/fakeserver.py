@@ -0,0 +1,605 @@
+""" Local stand-in for the netflix api, answering the oauth, catalog, user, queue, rating and catalog
+download endpoints with canned json, so that the client (and the services built on it) can be exercised
+without network access or credentials
+"""
+
+import re
+import time
+import json
+import gzip
+import random
+import urllib
+import socket
+import hashlib
+import threading
+from cStringIO import StringIO
+from urlparse import urlparse, parse_qs
+from email.utils import formatdate
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+_ADJECTIVES = (u'Dark', u'Silent', u'Last', u'Lost', u'Red', u'Hidden', u'Broken', u'Wild', u'Final', u'Golden')
+_NOUNS = (u'Matrix', u'River', u'Kingdom', u'Horizon', u'Empire', u'Garden', u'Signal', u'Harbor', u'Frontier',
+          u'Mirror')
+_FIRST_TITLE_ID = 70000000
+_QUEUE_LENGTH = 50
+_OAUTH_PARAM_RE = re.compile(r'(oauth_\w+)="([^"]*)"')
+_ROUTES = [
+    ('POST', r'/oauth/request_token', 'request_token'),
+    ('GET', r'/oauth/login', 'login'),
+    ('POST', r'/oauth/access_token', 'access_token'),
+    ('GET', r'/catalog/titles', 'search_titles'),
+    ('GET', r'/catalog/titles/autocomplete', 'autocomplete'),
+    ('GET', r'/catalog/titles/(full|streaming|dvd|index)', 'catalog'),
+    ('GET', r'/catalog/titles/movies/(\d+)', 'title'),
+    ('GET', r'/catalog/titles/movies/(\d+)/(\w+)', 'title_category'),
+    ('GET', r'/users/([^/]+)', 'user'),
+    ('GET', r'/users/([^/]+)/queues(?:/(instant|disc))?', 'queue'),
+    ('GET', r'/users/([^/]+)/queues/(instant|disc)/(available|saved)(?:/(\d+))?', 'queue'),
+    ('POST', r'/users/([^/]+)/queues/(instant|disc)', 'add_to_queue'),
+    ('DELETE', r'/users/([^/]+)/queues/(instant|disc)/(available|saved)/(\d+)', 'remove_from_queue'),
+    ('GET', r'/users/([^/]+)/ratings/title(?:/(actual|predicted))?', 'ratings'),
+    ('POST', r'/users/([^/]+)/ratings/title/actual', 'add_rating'),
+    ('GET', r'/users/([^/]+)/ratings/title/actual/(\d+)', 'rating'),
+    ('PUT', r'/users/([^/]+)/ratings/title/actual/(\d+)', 'update_rating'),
+    ('GET', r'/users/([^/]+)/recommendations', 'recommendations'),
+]
+
+# Canned values of the title detail categories, see pyflix2.EXPANDS
+_CATEGORIES = {
+    'synopsis': u'A story about the %(name)s.',
+    'short_synopsis': u'The %(name)s.',
+    'format_availability': [{'category': {'label': u'instant'}}, {'category': {'label': u'DVD'}}],
+    'screen_formats': [{'category': [{'label': u'1.85:1'}]}],
+    'cast': [{'name': u'Fake Actor %(n)d', 'id': u'%(base_url)s/catalog/people/%(n)d'}],
+    'directors': [{'name': u'Fake Director %(n)d', 'id': u'%(base_url)s/catalog/people/%(n)d'}],
+    'languages_and_audio': [{'language': u'English', 'audio': [u'5.1']}],
+    'awards': [],
+    'similars': [],
+    'bonus_materials': [],
+    'seasons': [],
+    'episodes': [],
+    'discs': [],
+}
+
+
+class _Fault(object):
+    """ A failure injected into the responses of the requests matching ``path``"""
+
+    def __init__(self, status, path, count, headers, delay, drop, truncate):
+        self.status = status
+        self.path = re.compile(path) if path else None
+        self.count = count
+        self.headers = headers or {}
+        self.delay = delay
+        self.drop = drop
+        self.truncate = truncate
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+    allow_reuse_address = True
+
+    def __init__(self, *args, **kwargs):
+        HTTPServer.__init__(self, *args, **kwargs)
+        self._connections = set()
+        self._closed = threading.Condition()
+        self.accepted = 0
+
+    def process_request(self, request, client_address):
+        with self._closed:
+            self._connections.add(request)
+            self.accepted += 1
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def shutdown_request(self, request):
+        HTTPServer.shutdown_request(self, request)
+        with self._closed:
+            self._connections.discard(request)
+            self._closed.notify_all()
+
+    def close_connections(self, timeout):
+        """ Hangs up on the clients, the connections kept alive included, and waits (upto ``timeout``
+        seconds) for their threads to be done"""
+        deadline = time.time() + timeout
+        with self._closed:
+            for request in self._connections:
+                try:
+                    request.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+            while self._connections and time.time() < deadline:
+                self._closed.wait(deadline - time.time())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in one write, instead of stalling on delayed acks between small writes
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    # Bound to the class so that they can still be caught while the interpreter shuts down
+    _hangup_errors = (socket.error,)
+
+    def handle(self):
+        # A client hanging up (e.g. once it timed out) isn't an error of the server
+        try:
+            BaseHTTPRequestHandler.handle(self)
+        except self._hangup_errors:
+            self.close_connection = 1
+
+    def finish(self):
+        try:
+            BaseHTTPRequestHandler.finish(self)
+        except self._hangup_errors:
+            pass
+
+    def _handle(self):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+        fault = fake._take_fault(self.path)
+        delay = fake._delay() + (fault.delay if fault else 0)
+        if delay:
+            time.sleep(delay)
+        if fault and fault.drop:
+            self.close_connection = 1
+            return
+        if fault and fault.status:
+            status, headers, content = fake._error(fault.status, 'Injected fault')
+        else:
+            status, headers, content = fake.dispatch(self.command, self.path, self.headers, body)
+        if fault:
+            headers = headers + fault.headers.items()
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        if self.close_connection:
+            # Tells the client not to reuse the connection (e.g. it asked for ``Connection: close``)
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        if fault and fault.truncate is not None:
+            content = content[:fault.truncate]
+            self.close_connection = 1
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeNetflixServer(object):
+    """ HTTP server imitating the netflix api on a local port, serving a generated catalog of ``titles``
+    titles. Point a client at it with the ``base_url`` option::
+
+        with FakeNetflixServer() as server:
+            netflix = NetflixAPIV2('appname', 'key', 'shared_secret', base_url=server.base_url)
+            netflix.search_titles('matrix')
+
+    It implements the oauth token flow (the request tokens are authorized by fetching their ``login_url``
+    or calling :py:meth:`authorize`), catalog search and autocomplete, the title details and their
+    categories, users, queues with ``ETag`` concurrency control, ratings, recommendations and the catalog
+    download (with ``Range`` and conditional requests). Queues and ratings are kept in memory, per user.
+
+    OAuth signatures are not verified. Unless ``strict_auth`` is set the user endpoints accept any access token.
+    The server runs on daemon threads of the calling process, its state is shared by all the connections.
+    The number of requests received so far is kept in ``request_count``, the number of connections
+    accepted in ``connection_count``.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, titles=1000, latency=0, jitter=0, error_rate=0, seed=None,
+                 strict_auth=False):
+        """
+        :param host: (Optional) The address to listen on
+        :param port: (Optional) The port to listen on, by default a free port is picked
+        :param titles: (Optional) The number of titles in the catalog
+        :param latency: (Optional) The number of seconds every response is delayed by
+        :param jitter: (Optional) Upto how many seconds are randomly added to ``latency``
+        :param error_rate: (Optional) The ratio of the requests answered with a ``503`` at random
+        :param seed: (Optional) Seed of the random jitter and errors, to replay the same run
+        :param strict_auth: (Optional) If set the user endpoints require an access token issued by the
+            server to that user, others are answered with a ``401``
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.strict_auth = strict_auth
+        self._random = random.Random(seed)
+        self._httpd = _ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.fake = self
+        self._thread = None
+        self._lock = threading.Lock()
+        self._routes = [(method, re.compile(pattern + '$'), getattr(self, '_' + name))
+                        for method, pattern, name in _ROUTES]
+        self._titles = [self._make_title(n) for n in range(titles)]
+        self._names = [title['title'].lower() for title in self._titles]
+        self._catalog = None
+        self._catalog_etag = None
+        self._catalog_modified = None
+        self._faults = []
+        self._request_tokens = {}
+        self._access_tokens = {}
+        self._queues = {}
+        self._ratings = {}
+        self.request_count = 0
+
+    @property
+    def base_url(self):
+        """ The url to pass as ``base_url`` to the client"""
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def title_id(self, n):
+        """ Returns the id (an url) of the ``n``-th title of the catalog"""
+        return '%s/catalog/titles/movies/%d' % (self.base_url, _FIRST_TITLE_ID + n)
+
+    def start(self):
+        """ Starts serving in background, returns the server"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='pyflix2-fake-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        """ Stops serving, closes the listening socket and the connections to the clients, waiting
+        (upto ``timeout`` seconds) for the requests being answered"""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+        self._httpd.close_connections(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def inject_fault(self, status=503, path=None, count=1, headers=None, delay=0, drop=False, truncate=None):
+        """ Makes the next ``count`` requests (matching ``path``) fail. E.g. to answer the next request
+        with a quota error, then to cut the catalog download short::
+
+            server.inject_fault(403, headers={'X-Mashery-Error-Code': 'ERR_403_DEVELOPER_OVER_QPS'})
+            server.inject_fault(None, path='/catalog/titles/full', truncate=1024)
+
+        :param status: (Optional) The status of the error response, ``None`` to send the normal response
+            (along with ``headers``, ``delay`` and ``truncate``)
+        :param path: (Optional) Regular expression the path of the request is searched for, by default
+            any request matches
+        :param count: (Optional) The number of requests failed, ``None`` for all of them
+        :param headers: (Optional) ``dict`` of headers added to the response, e.g. ``Retry-After``
+        :param delay: (Optional) The number of seconds the response is delayed by, on top of the latency
+        :param drop: (Optional) If set the connection is closed without any response
+        :param truncate: (Optional) The number of bytes of the body sent before the connection is closed
+        """
+        with self._lock:
+            self._faults.append(_Fault(status, path, count, headers, delay, drop, truncate))
+
+    def clear_faults(self):
+        """ Removes the faults injected and not triggered yet"""
+        with self._lock:
+            self._faults = []
+
+    def authorize(self, request_token):
+        """ Authorizes ``request_token`` as the user would by signing in on the netflix website,
+        returns the verification code to pass to ``get_access_token()``"""
+        with self._lock:
+            token = self._request_tokens[request_token]
+            token['authorized'] = True
+            return token['verifier']
+
+    @property
+    def connection_count(self):
+        """ The number of connections accepted so far"""
+        return self._httpd.accepted
+
+    def _take_fault(self, path):
+        with self._lock:
+            self.request_count += 1
+            for fault in self._faults:
+                if fault.path is None or fault.path.search(path):
+                    if fault.count is not None:
+                        fault.count -= 1
+                        if fault.count <= 0:
+                            self._faults.remove(fault)
+                    return fault
+            if self.error_rate and self._random.random() < self.error_rate:
+                return _Fault(503, None, 1, None, 0, False, None)
+        return None
+
+    def _delay(self):
+        if not self.jitter:
+            return self.latency
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def dispatch(self, method, path, headers, body):
+        """ Answers a request, returns the status, the list of headers and the body of the response"""
+        url = urlparse(path)
+        params = dict((key, values[-1]) for key, values in parse_qs(url.query).iteritems())
+        if body:
+            params.update((key, values[-1]) for key, values in parse_qs(body).iteritems())
+        # OAuth parameters come either in the query (user requests) or in the Authorization header
+        for key, value in _OAUTH_PARAM_RE.findall(headers.get('Authorization') or ''):
+            params.setdefault(key, urllib.unquote(value))
+        for route_method, pattern, handler in self._routes:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                if url.path.startswith('/users/') and not self._is_authorized(match.group(1), params):
+                    return self._error(401, 'Invalid or missing access token')
+                return handler(params, headers, *match.groups())
+        return self._error(404, 'Resource not found: %s' % url.path)
+
+    def _is_authorized(self, user_id, params):
+        if not self.strict_auth:
+            return True
+        with self._lock:
+            return self._access_tokens.get(params.get('oauth_token')) == user_id
+
+    def _make_title(self, n):
+        name = u'%s %s %d' % (_ADJECTIVES[n % len(_ADJECTIVES)], _NOUNS[n // len(_ADJECTIVES) % len(_NOUNS)], n)
+        return {'id': self.title_id(n),
+                'title': name,
+                'release_year': 1950 + n % 70,
+                'runtime': 5400 + n % 3600,
+                'average_rating': round(1 + n % 40 / 10.0, 1),
+                'box_art': {'small': 'http://cdn.example.com/boxshots/%d.jpg' % n},
+                'categories': [{'label': u'Drama', 'scheme': 'genres'}]}
+
+    def _shaped(self, params, title):
+        """ Returns ``title`` as answered to the api version of the request, the titles are kept in the
+        V2 shape where ``title`` is a string, V1 has a ``{"regular": .., "short": ..}`` dict"""
+        if params.get('v') == '2.0':
+            return title
+        return dict(title, title={'regular': title['title'], 'short': title['title']})
+
+    def _json(self, document, status=200, headers=()):
+        return status, [('Content-Type', 'application/json')] + list(headers), json.dumps(document)
+
+    def _form(self, values):
+        return 200, [('Content-Type', 'application/x-www-form-urlencoded')], urllib.urlencode(values)
+
+    def _status(self, status, message, **fields):
+        fields.update(status_code=status, message=message)
+        return self._json({'status': fields}, status)
+
+    def _error(self, status, message):
+        return self._status(status, message)
+
+    def _page(self, params, items):
+        start_index = int(params.get('start_index') or 0)
+        max_results = min(int(params.get('max_results') or 25), 100)
+        return start_index, max_results, items[start_index:start_index + max_results]
+
+    def _token(self, user_id=None):
+        return hashlib.sha1('%s-%s' % (user_id, self._random.random())).hexdigest()[:24]
+
+    def _request_token(self, params, headers):
+        with self._lock:
+            token, secret = self._token(), self._token()
+            self._request_tokens[token] = {'secret': secret, 'verifier': self._token()[:8], 'authorized': False,
+                                           'oob': params.get('oauth_callback') == 'oob'}
+        return self._form({'oauth_token': token, 'oauth_token_secret': secret,
+                           'login_url': '%s/oauth/login?oauth_token=%s' % (self.base_url, token)})
+
+    def _login(self, params, headers):
+        if params.get('oauth_token') not in self._request_tokens:
+            return self._error(401, 'Unknown request token')
+        return self._form({'oauth_verifier': self.authorize(params['oauth_token'])})
+
+    def _access_token(self, params, headers):
+        with self._lock:
+            token = self._request_tokens.get(params.get('oauth_token'))
+            if token is None or not token['authorized']:
+                return self._error(401, 'Request token not authorized')
+            if token['oob'] and params.get('oauth_verifier') != token['verifier']:
+                return self._error(401, 'Invalid verification code')
+            del self._request_tokens[params['oauth_token']]
+            user_id = 'T1%s' % self._token()[:10]
+            access_token, secret = self._token(user_id), self._token(user_id)
+            self._access_tokens[access_token] = user_id
+        return self._form({'user_id': user_id, 'oauth_token': access_token, 'oauth_token_secret': secret})
+
+    def _search_titles(self, params, headers):
+        term = params.get('term', '').lower()
+        matches = [title for title, name in zip(self._titles, self._names) if term in name]
+        start_index, max_results, page = self._page(params, matches)
+        page = [self._shaped(params, title) for title in page]
+        if params.get('v') == '2.0':
+            return self._json({'catalog': page, 'number_of_results': len(matches), 'start_index': start_index,
+                               'results_per_page': max_results})
+        return self._json({'catalog_titles': {'catalog_title': page, 'number_of_results': len(matches),
+                                              'start_index': start_index, 'results_per_page': max_results}})
+
+    def _autocomplete(self, params, headers):
+        term = params.get('term', '').lower()
+        matches = [title['title'] for title, name in zip(self._titles, self._names)
+                   if any(word.startswith(term) for word in name.split())]
+        start_index, max_results, page = self._page(params, matches)
+        if params.get('v') == '2.0':
+            return self._json({'autocomplete': {'title': page}})
+        return self._json({'autocomplete': {'autocomplete_item': [{'title': {'short': name}} for name in page]}})
+
+    def _find_title(self, title_id):
+        n = int(title_id) - _FIRST_TITLE_ID
+        return self._titles[n] if 0 <= n < len(self._titles) else None
+
+    def _title(self, params, headers, title_id):
+        title = self._find_title(title_id)
+        if title is None:
+            return self._error(404, 'Title not found')
+        return self._json({'catalog_title': self._shaped(params, title)})
+
+    def _title_category(self, params, headers, title_id, category):
+        title = self._find_title(title_id)
+        if title is None:
+            return self._error(404, 'Title not found')
+        if category in ('title', 'box_art'):
+            return self._json({category: self._shaped(params, title)[category]})
+        if category not in _CATEGORIES:
+            return self._error(404, 'Unknown category: %s' % category)
+        values = {'name': title['title'], 'n': int(title_id), 'base_url': self.base_url}
+        return self._json({category: _fill(_CATEGORIES[category], values)})
+
+    def _catalog(self, params, headers, catalog_type):
+        with self._lock:
+            if self._catalog is None:
+                buf = StringIO()
+                with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                    f.write(json.dumps(self._titles))
+                self._catalog = buf.getvalue()
+                self._catalog_etag = '"%s"' % hashlib.sha1(self._catalog).hexdigest()
+                self._catalog_modified = formatdate(usegmt=True)
+        validators = [('ETag', self._catalog_etag), ('Last-Modified', self._catalog_modified)]
+        if (headers.get('If-None-Match') == self._catalog_etag or
+                headers.get('If-Modified-Since') == self._catalog_modified):
+            return 304, validators, ''
+        match = re.match(r'bytes=(\d+)-$', headers.get('Range') or '')
+        if match and headers.get('If-Range') in (None, self._catalog_etag, self._catalog_modified):
+            offset = int(match.group(1))
+            if offset >= len(self._catalog):
+                return 416, [('Content-Range', 'bytes */%d' % len(self._catalog))], ''
+            return 206, validators + [('Content-Type', 'application/x-gzip'), ('Content-Range', 'bytes %d-%d/%d' % (
+                offset, len(self._catalog) - 1, len(self._catalog)))], self._catalog[offset:]
+        return 200, validators + [('Content-Type', 'application/x-gzip')], self._catalog
+
+    def _user(self, params, headers, user_id):
+        return self._json({'user': {'user_id': user_id, 'first_name': u'Fake', 'last_name': u'User',
+                                    'nickname': u'fake', 'can_instant_watch': True,
+                                    'preferred_formats': [{'category': {'label': u'instant'}}]}})
+
+    def _queue_state(self, user_id, kind):
+        """ Returns the queue of ``user_id`` (must be called holding the lock), as a dict of the
+        ``etag`` and the list of the ``titles`` numbers in queue order"""
+        key = (user_id, kind)
+        if key not in self._queues:
+            self._queues[key] = {'etag': 1, 'titles': range(min(_QUEUE_LENGTH, len(self._titles)))}
+        return self._queues[key]
+
+    def _queue_item(self, user_id, kind, n, position):
+        title = self._titles[n]
+        return {'id': '%s/users/%s/queues/%s/available/%d' % (self.base_url, user_id, kind, _FIRST_TITLE_ID + n),
+                'position': position, 'title': title['title'], 'link': [{'href': title['id']}]}
+
+    def _queue(self, params, headers, user_id, kind, availability=None, entry_id=None):
+        kind = kind or 'instant'
+        with self._lock:
+            queue = self._queue_state(user_id, kind)
+            titles, etag = list(queue['titles']), str(queue['etag'])
+        # Every title of the queue is available, the saved queue is always empty
+        if availability == 'saved':
+            titles = []
+        items = [self._queue_item(user_id, kind, n, i + 1) for i, n in enumerate(titles)]
+        if entry_id is not None:
+            items = [item for item in items if item['id'].endswith('/' + entry_id)]
+            if not items:
+                return self._error(404, 'Queue entry not found')
+        start_index, max_results, page = self._page(params, items)
+        return self._json({'queue': {'queue_item': page, 'number_of_results': len(items), 'start_index': start_index,
+                                     'results_per_page': max_results, 'etag': etag}})
+
+    def _add_to_queue(self, params, headers, user_id, kind):
+        title_id = params.get('title_ref', '').rpartition('/')[2]
+        title = self._find_title(title_id) if title_id.isdigit() else None
+        if title is None:
+            return self._error(404, 'Title not found')
+        n = int(title_id) - _FIRST_TITLE_ID
+        with self._lock:
+            queue = self._queue_state(user_id, kind)
+            if params.get('etag') != str(queue['etag']):
+                return self._status(412, 'Title queue has been modified', sub_code=710)
+            moved = n in queue['titles']
+            if moved:
+                queue['titles'].remove(n)
+            position = min(max(int(params.get('position') or len(queue['titles']) + 1), 1), len(queue['titles']) + 1)
+            queue['titles'].insert(position - 1, n)
+            queue['etag'] += 1
+            etag = str(queue['etag'])
+        item = self._queue_item(user_id, kind, n, position)
+        if moved:
+            return self._status(201, 'Move successful', etag=etag, resources_created={'queue_item': item})
+        return self._status(201, 'Title added to queue', etag=etag, resources_created={'queue_item': item})
+
+    def _remove_from_queue(self, params, headers, user_id, kind, availability, entry_id):
+        n = int(entry_id) - _FIRST_TITLE_ID
+        with self._lock:
+            queue = self._queue_state(user_id, kind)
+            if availability == 'saved' or n not in queue['titles']:
+                return self._error(404, 'Queue entry not found')
+            queue['titles'].remove(n)
+            queue['etag'] += 1
+            etag = str(queue['etag'])
+        return self._status(200, 'Title deleted from queue', etag=etag)
+
+    def _rating_item(self, user_id, n, kind=None):
+        title = self._titles[n]
+        item = {'id': title['id'], 'title': title['title']}
+        if kind != 'predicted':
+            with self._lock:
+                item['user_rating'] = self._ratings.get((user_id, n), 1 + n % 5)
+        if kind != 'actual':
+            item['predicted_rating'] = title['average_rating']
+        return item
+
+    def _ratings(self, params, headers, user_id, kind):
+        items = []
+        for ref in filter(None, params.get('title_refs', '').split(',')):
+            title_id = ref.rpartition('/')[2]
+            if title_id.isdigit() and self._find_title(title_id) is not None:
+                items.append(self._rating_item(user_id, int(title_id) - _FIRST_TITLE_ID, kind))
+        # Like netflix, a single item isn't wrapped in a list
+        return self._json({'ratings': {'ratings_item': items[0] if len(items) == 1 else items}})
+
+    def _set_rating(self, user_id, title_id, rating, status, message):
+        title = self._find_title(title_id) if title_id.isdigit() else None
+        if title is None:
+            return self._error(404, 'Title not found')
+        if not str(rating).isdigit() or not 1 <= int(rating) <= 5:
+            return self._error(400, 'Invalid rating: %s' % rating)
+        n = int(title_id) - _FIRST_TITLE_ID
+        with self._lock:
+            self._ratings[(user_id, n)] = int(rating)
+        item = self._rating_item(user_id, n, 'actual')
+        item['id'] = '%s/users/%s/ratings/title/actual/%s' % (self.base_url, user_id, title_id)
+        return self._status(status, message, resources_created={'ratings_item': item})
+
+    def _add_rating(self, params, headers, user_id):
+        title_id = params.get('title_ref', '').rpartition('/')[2]
+        return self._set_rating(user_id, title_id, params.get('rating'), 201, 'Rating created')
+
+    def _rating(self, params, headers, user_id, title_id):
+        n = int(title_id) - _FIRST_TITLE_ID
+        with self._lock:
+            rated = (user_id, n) in self._ratings
+        if not rated:
+            return self._error(404, 'Rating not found')
+        return self._json({'ratings': {'ratings_item': [self._rating_item(user_id, n, 'actual')]}})
+
+    def _update_rating(self, params, headers, user_id, title_id):
+        return self._set_rating(user_id, title_id, params.get('rating'), 200, 'Rating updated')
+
+    def _recommendations(self, params, headers, user_id):
+        # Titles not in the instant queue, best rated first
+        with self._lock:
+            queued = set(self._queue_state(user_id, 'instant')['titles'])
+        titles = sorted((title for n, title in enumerate(self._titles) if n not in queued),
+                        key=lambda title: -title['average_rating'])
+        start_index, max_results, page = self._page(params, titles)
+        return self._json({'recommendations': {'recommendation': page, 'number_of_results': len(titles),
+                                               'start_index': start_index, 'results_per_page': max_results}})
+
+
+def _fill(value, values):
+    """ Formats the strings nested in ``value`` with ``values``"""
+    if isinstance(value, basestring):
+        return value % values
+    if isinstance(value, list):
+        return [_fill(item, values) for item in value]
+    if isinstance(value, dict):
+        return dict((key, _fill(item, values)) for key, item in value.iteritems())
+    return value
@@ -0,0 +1,273 @@
+""" Local indexes built from the catalog, for answering catalog queries without calling netflix
+"""
+
+import json
+import sqlite3
+import threading
+from array import array
+
+# Bit set against a title in AutocompleteIndex for each filter it is available in
+_FILTER_BITS = {'instant': 1, 'disc': 2}
+
+
+def _text(value):
+    """ Returns the text of a title field, V2 catalog has plain strings where V1 has
+    ``{"regular": .., "short": ..}`` dicts"""
+    if isinstance(value, dict):
+        return value.get('regular') or value.get('short') or value.get('text') or u''
+    if isinstance(value, basestring):
+        return value
+    return u''
+
+
+class TitleIndex(object):
+    """ SQLite backed store of catalog titles keyed by title id, with a full text index over
+    the title and synopsis::
+
+        index = TitleIndex('catalog.db')
+        index.import_catalog(netflix.get_catalog(parse=True))
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', title_index=index)
+    """
+
+    def __init__(self, path=':memory:'):
+        """
+        :param path: (Optional) The database file, the index is kept in memory if not given
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS titles ('
+                         'id TEXT PRIMARY KEY, title TEXT, synopsis TEXT, record TEXT)')
+        try:
+            self._db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS titles_fts USING fts4(title, synopsis)')
+            self._fts = True
+        except sqlite3.OperationalError:
+            # sqlite built without full text search, searches fall back to LIKE
+            self._fts = False
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM titles').fetchone()[0]
+
+    def import_catalog(self, titles, replace=True):
+        """ Stores the given titles in the index
+
+        :param titles: iterable of title records, e.g. ``get_catalog(parse=True)``
+        :param replace: (Optional) If set the current contents of the index are dropped first
+        :returns: The number of titles imported
+        """
+        count = 0
+        with self._lock:
+            try:
+                if replace:
+                    self._db.execute('DELETE FROM titles')
+                    if self._fts:
+                        self._db.execute('DELETE FROM titles_fts')
+                for title in titles:
+                    self._insert(title)
+                    count += 1
+                self._db.commit()
+            except:
+                self._db.rollback()
+                raise
+        return count
+
+    def _insert(self, title):
+        name = _text(title.get('title'))
+        synopsis = _text(title.get('synopsis') or title.get('short_synopsis'))
+        if self._fts:
+            row = self._db.execute('SELECT rowid FROM titles WHERE id = ?', (title['id'],)).fetchone()
+            if row:
+                self._db.execute('DELETE FROM titles_fts WHERE docid = ?', row)
+        cursor = self._db.execute('INSERT OR REPLACE INTO titles (id, title, synopsis, record) VALUES (?, ?, ?, ?)',
+                                  (title['id'], name, synopsis, json.dumps(title)))
+        if self._fts:
+            self._db.execute('INSERT INTO titles_fts (docid, title, synopsis) VALUES (?, ?, ?)',
+                             (cursor.lastrowid, name, synopsis))
+
+    def get(self, title_id):
+        """ Returns the title record with the given id, ``None`` if it is not in the index"""
+        with self._lock:
+            row = self._db.execute('SELECT record FROM titles WHERE id = ?', (title_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_title(self, title_id):
+        """ Same as :py:meth:`get`, but the result is shaped like the response of
+        :py:meth:`~pyflix2.NetflixAPIV2.get_title`"""
+        title = self.get(title_id)
+        return {'catalog_title': title} if title is not None else None
+
+    def search(self, term, start_index=0, max_results=25):
+        """ Searches the title and synopsis of the titles for ``term``, titles whose title
+        matches exactly are returned first.
+
+        :returns: the tuple ``(number_of_results, titles)``
+        """
+        words = term.split()
+        if not words:
+            return 0, []
+        if self._fts:
+            match = u' '.join(u'"%s"' % word.replace(u'"', u'') for word in words)
+            where = 'rowid IN (SELECT docid FROM titles_fts WHERE titles_fts MATCH ?)'
+            params = (match,)
+        else:
+            where = ' AND '.join(['(title LIKE ? OR synopsis LIKE ?)'] * len(words))
+            params = tuple(p for word in words for p in (u'%%%s%%' % word,) * 2)
+        with self._lock:
+            total = self._db.execute('SELECT COUNT(*) FROM titles WHERE ' + where, params).fetchone()[0]
+            rows = self._db.execute('SELECT record FROM titles WHERE ' + where +
+                                    ' ORDER BY title = ? COLLATE NOCASE DESC, rowid LIMIT ? OFFSET ?',
+                                    params + (term, max_results or 25, start_index or 0)).fetchall()
+        return total, [json.loads(row[0]) for row in rows]
+
+    def search_titles(self, term, start_index=0, max_results=25):
+        """ Same as :py:meth:`search`, but the result is shaped like the response of
+        :py:meth:`~pyflix2.NetflixAPIV2.search_titles`"""
+        total, titles = self.search(term, start_index, max_results)
+        return {'catalog': titles, 'number_of_results': total,
+                'start_index': start_index or 0, 'results_per_page': max_results or 25}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class AutocompleteIndex(object):
+    """ In memory prefix index over the short titles of the catalog, answering
+    :py:meth:`~pyflix2.NetflixAPIV2.title_autocomplete` without a round trip to netflix.
+    A title matches if any of its words starts with the search text::
+
+        autocomplete = AutocompleteIndex()
+        autocomplete.import_catalog(netflix.get_catalog('streaming', parse=True), filter='instant')
+        autocomplete.import_catalog(netflix.get_catalog('dvd', parse=True), filter='disc')
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', autocomplete_index=autocomplete)
+
+    The index is an array of ``(title, word offset)`` references into the normalized titles, sorted by
+    the text from the offset on and searched by bisection, so the suffixes of the titles aren't copied.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._titles = []
+        self._normalized = []
+        self._filters = []
+        self._positions = {}
+        self._pending = []
+        # The references to the word suffixes, as the parallel arrays of title positions and offsets
+        self._index = (array('l'), array('l'))
+
+    def __len__(self):
+        return len(self._titles)
+
+    def import_catalog(self, titles, filter=None):
+        """ Adds the short titles of the given catalog titles to the index
+
+        :param titles: iterable of title records, e.g. ``get_catalog(parse=True)``
+        :param filter: (Optional) Either `"instant"` or `"disc"`, the availability of the titles
+            used when a search is made with a ``filter``
+        :returns: The number of titles imported
+        """
+        count = 0
+        for title in titles:
+            self.add(_short_title(title.get('title')), filter)
+            count += 1
+        return count
+
+    def add(self, title, filter=None):
+        """ Adds a single short title to the index
+
+        :param title: The short title
+        :param filter: (Optional) Either `"instant"` or `"disc"`
+        """
+        if not title:
+            return
+        bit = _FILTER_BITS[filter] if filter else 0
+        with self._lock:
+            position = self._positions.get(title)
+            if position is not None:
+                self._filters[position] |= bit
+                return
+            position = len(self._titles)
+            normalized = _normalize(title)
+            self._positions[title] = position
+            self._titles.append(title)
+            self._normalized.append(normalized)
+            self._filters.append(bit)
+            self._pending.append((position, 0))
+            offset = normalized.find(u' ')
+            while offset >= 0:
+                self._pending.append((position, offset + 1))
+                offset = normalized.find(u' ', offset + 1)
+
+    def _sort(self):
+        """ Merges the titles added since the last search into the sorted index"""
+        with self._lock:
+            if self._pending:
+                normalized = self._normalized
+                positions, offsets = self._index
+                entries = zip(positions, offsets) + self._pending
+                entries.sort(key=lambda (position, offset): normalized[position][offset:])
+                self._index = (array('l', [position for position, _ in entries]),
+                               array('l', [offset for _, offset in entries]))
+                self._pending = []
+
+    def search(self, term, filter=None, start_index=None, max_results=None):
+        """ Returns the short titles having a word that starts with ``term``, ordered by the
+        text following the match
+
+        :param term: The string to look for partial match in short titles
+        :param filter: (Optional) Either `"instant"` or `"disc"`
+        :param start_index: (Optional) The zero-based offset into the list of matching titles
+        :param max_results: (Optional) The maximum number of results to return, 25 by default
+        :rtype: list
+        """
+        if self._pending:
+            self._sort()
+        prefix = _normalize(term)
+        if not prefix:
+            return []
+        bit = _FILTER_BITS[filter] if filter else 0
+        start_index = start_index or 0
+        end_index = start_index + (max_results or 25)
+        normalized = self._normalized
+        positions, offsets = self._index
+        length = len(prefix)
+        suffix = lambda i: normalized[positions[i]][offsets[i]:offsets[i] + length]
+
+        # The first suffix starting with the prefix, comparing only as many characters as it has
+        low, high = 0, len(positions)
+        while low < high:
+            middle = (low + high) // 2
+            if suffix(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        seen = set()
+        matches = []
+        i = low
+        while i < len(positions) and len(matches) < end_index and suffix(i) == prefix:
+            position = positions[i]
+            i += 1
+            if position in seen or (bit and not self._filters[position] & bit):
+                continue
+            seen.add(position)
+            matches.append(position)
+        return [self._titles[position] for position in matches[start_index:end_index]]
+
+    def title_autocomplete(self, term, filter=None, start_index=None, max_results=None):
+        """ Same as :py:meth:`search`, but the result is shaped like the response of
+        :py:meth:`~pyflix2.NetflixAPIV2.title_autocomplete`"""
+        titles = self.search(term, filter=filter, start_index=start_index, max_results=max_results)
+        if not titles:
+            return {'autocomplete': {}}
+        return {'autocomplete': {'title': titles}}
+
+
+def _short_title(value):
+    if isinstance(value, dict):
+        return value.get('short') or value.get('regular') or u''
+    return _text(value)
+
+
+def _normalize(text):
+    return u' '.join(text.lower().split())
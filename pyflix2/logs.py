@@ -0,0 +1,137 @@
+""" Non blocking log writers, so that writing the log never holds up a request
+"""
+
+import sys
+import logging
+import threading
+from Queue import Queue, Full
+
+_STOP = object()
+
+
+class _BackgroundQueue(object):
+    """ Bounded queue drained by a daemon thread calling ``consume`` for each item. Items put while the
+    queue is full are dropped (and counted) rather than blocking the caller"""
+
+    def __init__(self, consume, max_queue):
+        self.dropped = 0
+        self._consume = consume
+        self._queue = Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name='pyflix2-log-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._consume(item)
+            except Exception:
+                pass
+            finally:
+                self._queue.task_done()
+
+    def empty(self):
+        """ Returns True if no item is waiting to be consumed"""
+        return self._queue.empty()
+
+    def join(self):
+        """ Waits for the queued items to be consumed"""
+        self._queue.join()
+
+    def stop(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+class BackgroundWriter(object):
+    """ File like object writing to ``stream`` from a background thread, to be passed as the ``logger``
+    of the client::
+
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', logger=BackgroundWriter(sys.stderr))
+
+    ``write()`` only queues the text. Once ``max_queue`` writes are pending further ones are dropped,
+    their count is kept in :py:attr:`dropped`.
+    """
+
+    def __init__(self, stream=None, max_queue=10000):
+        """
+        :param stream: (Optional) The stream to write to, ``sys.stderr`` by default
+        :param max_queue: (Optional) The maximum number of writes pending
+        """
+        self.stream = stream or sys.stderr
+        self._queue = _BackgroundQueue(self._write, max_queue)
+
+    @property
+    def dropped(self):
+        """ The number of writes dropped because the queue was full"""
+        return self._queue.dropped
+
+    def _write(self, text):
+        self.stream.write(text)
+        if self._queue.empty():
+            self.stream.flush()
+
+    def write(self, text):
+        self._queue.put(text)
+
+    def flush(self):
+        """ Waits for the pending writes to be written"""
+        self._queue.join()
+
+    def close(self):
+        """ Writes the pending writes and stops the writer thread"""
+        self._queue.stop()
+        self.stream.flush()
+
+
+class QueueHandler(logging.Handler):
+    """ ``logging`` handler passing the records to ``handler`` from a background thread, so that a
+    slow handler (file, socket, ...) doesn't slow down the requests logging through it::
+
+        logger = logging.getLogger('pyflix2')
+        logger.addHandler(QueueHandler(logging.FileHandler('netflix.log')))
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', logger=logger)
+
+    The records are formatted by the background thread. Once ``max_queue`` records are pending
+    further ones are dropped, their count is kept in :py:attr:`dropped`.
+    """
+
+    def __init__(self, handler, max_queue=10000):
+        """
+        :param handler: The ``logging.Handler`` doing the actual output
+        :param max_queue: (Optional) The maximum number of records pending
+        """
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self._queue = _BackgroundQueue(self.handler.handle, max_queue)
+
+    @property
+    def dropped(self):
+        """ The number of records dropped because the queue was full"""
+        return self._queue.dropped
+
+    def emit(self, record):
+        # The exception is rendered now, the traceback can't be formatted once the frame is gone
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self._queue.put(record)
+
+    def flush(self):
+        """ Waits for the pending records to be handled"""
+        self._queue.join()
+        self.handler.flush()
+
+    def close(self):
+        self._queue.stop()
+        self.handler.close()
+        logging.Handler.close(self)
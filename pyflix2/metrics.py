@@ -0,0 +1,158 @@
+""" Instrumentation of the requests made by the netflix client
+"""
+
+import time
+import threading
+from urlparse import urlparse
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+""" Upper bounds (in seconds) of the latency histogram buckets of :py:class:`Metrics`"""
+
+
+def endpoint_template(url):
+    """ Returns the path of ``url`` with the ids replaced by placeholders, e.g.
+    ``/catalog/titles/movies/{id}`` or ``/users/{user_id}/queues/instant``, so that
+    requests to the same endpoint are counted together"""
+    segments = urlparse(url).path.split('/')
+    for i in range(1, len(segments)):
+        if segments[i - 1] == 'users' and segments[i]:
+            segments[i] = '{user_id}'
+        elif segments[i].isdigit():
+            segments[i] = '{id}'
+    return '/'.join(segments)
+
+
+class RequestHook(object):
+    """ Base class of the objects passed in the ``hooks`` option of the client, which are called
+    around each request. Both methods receive the same ``event`` dict, having the keys:
+
+        - ``method``, ``url``: the request
+        - ``endpoint``: the url path with placeholders for the ids, see :py:func:`endpoint_template`
+        - ``cache``: ``"hit"``, ``"stale"`` or ``"miss"`` if the request could be cached, else ``None``
+        - ``coalesced``: True if the response of an identical concurrent request was reused
+        - ``retries``: the number of retries made
+        - ``status``: the response status, ``None`` if no response was received
+        - ``request_bytes``: the size of the url and body of the request
+        - ``response_bytes``: the size of the response body, ``None`` if it is unknown (streamed responses)
+        - ``elapsed``: the number of seconds the request took, retries included
+        - ``error``: the exception raised, ``None`` if the request succeeded
+
+    The keys filled in after the response are only set for :py:meth:`after_request`. Hooks are called
+    on the thread making the request; errors they raise are logged and ignored.
+    """
+
+    def before_request(self, event):
+        pass
+
+    def after_request(self, event):
+        pass
+
+
+class _EndpointStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.statuses = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_min = None
+        self.latency_max = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+        self.cache = {}
+        self.coalesced = 0
+
+    def add(self, event):
+        self.count += 1
+        if event['error'] is not None:
+            self.errors += 1
+        status = event['status']
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        elapsed = event['elapsed']
+        i = 0
+        while i < len(LATENCY_BUCKETS) and elapsed > LATENCY_BUCKETS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.latency_sum += elapsed
+        self.latency_min = elapsed if self.latency_min is None else min(self.latency_min, elapsed)
+        self.latency_max = elapsed if self.latency_max is None else max(self.latency_max, elapsed)
+        self.request_bytes += event['request_bytes'] or 0
+        self.response_bytes += event['response_bytes'] or 0
+        self.retries += event['retries']
+        if event['cache']:
+            self.cache[event['cache']] = self.cache.get(event['cache'], 0) + 1
+        if event['coalesced']:
+            self.coalesced += 1
+
+    def percentile(self, q):
+        """ Estimates the ``q`` quantile as the upper bound of the bucket it falls in"""
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.latency_max
+        return self.latency_max
+
+    def snapshot(self):
+        return {'count': self.count,
+                'errors': self.errors,
+                'statuses': dict(self.statuses),
+                'latency': {'sum': self.latency_sum,
+                            'min': self.latency_min,
+                            'max': self.latency_max,
+                            'mean': self.latency_sum / self.count if self.count else None,
+                            'p50': self.percentile(0.5),
+                            'p95': self.percentile(0.95),
+                            'p99': self.percentile(0.99),
+                            'buckets': zip(LATENCY_BUCKETS + (None,), self.buckets)},
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes,
+                'retries': self.retries,
+                'cache': dict(self.cache),
+                'coalesced': self.coalesced}
+
+
+class Metrics(RequestHook):
+    """ Aggregates the requests of a client per endpoint: the number of requests, errors and response
+    statuses, a latency histogram, the bytes sent and received, retries and cache use::
+
+        metrics = Metrics()
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', hooks=[metrics])
+        ...
+        for endpoint, stats in metrics.snapshot().iteritems():
+            print endpoint, stats['count'], stats['latency']['p95']
+
+    It is thread safe and can be shared by several clients.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.started = time.time()
+
+    def after_request(self, event):
+        key = '%s %s' % (event['method'], event['endpoint'])
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats is None:
+                stats = self._endpoints[key] = _EndpointStats()
+            stats.add(event)
+
+    def snapshot(self):
+        """ Returns the statistics aggregated so far, as a ``dict`` keyed by ``"METHOD endpoint"``, e.g.
+        ``"GET /catalog/titles/movies/{id}"``. The values are plain dicts with the keys ``count``,
+        ``errors``, ``statuses`` (count per status), ``latency`` (``sum``, ``min``, ``max``, ``mean``,
+        ``p50``, ``p95``, ``p99`` in seconds and the histogram ``buckets`` as ``(upper_bound, count)``
+        pairs, the last bound being ``None``), ``request_bytes``, ``response_bytes``, ``retries``,
+        ``cache`` (count per cache outcome) and ``coalesced``"""
+        with self._lock:
+            return dict((key, stats.snapshot()) for key, stats in self._endpoints.iteritems())
+
+    def reset(self):
+        """ Drops the statistics aggregated so far"""
+        with self._lock:
+            self._endpoints = {}
+            self.started = time.time()
@@ -3,7 +3,11 @@
 
 import sys
 import os.path
+import socket
+import httplib
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import HTTPError as TransportError
 from requests_oauthlib import OAuth1
 import pprint
 import time
@@ -11,6 +15,16 @@ from datetime import datetime
 from urlparse import urlparse, parse_qs, parse_qsl, urlunparse
 import urllib
 import json
+import logging
+import threading
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from catalog import iter_titles
+from cache import cache_key, cache_ttl, to_entry, to_response
+from signing import get_signer
+from retry import RetryPolicy, RETRY_STATUSES
+from circuit import endpoint_family
+from metrics import endpoint_template
 
 __version__ = u"0.2.1"
 
@@ -42,11 +56,216 @@ CATALOG_TYPES_V1 = ['index'] + GENERIC_CATALOG_TYPES
 CATALOG_TYPES_V2 = ['full'] + GENERIC_CATALOG_TYPES
 """ Allowed catalog type to use while calling :py:meth:`~NetflixAPIV2.get_catalog`"""
 
+MAX_PAGE_SIZE = 100
+""" The largest ``max_results`` netflix accepts, used as page size by the ``iter_*`` methods"""
+
+MAX_TITLE_REFS = 25
+""" The number of titles whose ratings are requested in a single call, larger lists are split into batches"""
+
+MAX_REVALIDATIONS = 2
+""" The number of stale cache entries refreshed at a time in background, see ``stale_while_revalidate``"""
+
+# Error codes of the responses netflix sends once a quota is used up
+_QUOTA_ERROR_CODES = ('ERR_403_DEVELOPER_OVER_QPS', 'ERR_403_DEVELOPER_OVER_RATE')
+
+DEFAULT_TIMEOUT = (10, 60)
+""" The default ``(connect, read)`` timeouts of the requests, in seconds"""
+
+# Upto how many seconds to wait before resuming an interrupted catalog download, doubled at every attempt
+_RESUME_BACKOFF = 0.5
+_MAX_RESUME_BACKOFF = 30
+
+# Errors raised when a connection breaks while a response is being read
+_TRANSFER_ERRORS = (requests.exceptions.RequestException, TransportError, httplib.HTTPException, socket.error)
+
+# The deadline (a ``time.time()`` value) of the calls made by the current thread, see _NetflixAPI.deadline()
+_local = threading.local()
+
+
+def _current_deadline():
+    return getattr(_local, 'deadline', None)
+
+
+def _expires(seconds=None):
+    """ Returns the deadline of a call which has to complete within ``seconds``, or within the
+    deadline of the current thread if that is earlier"""
+    current = _current_deadline()
+    if seconds is None:
+        return current
+    expires = time.time() + seconds
+    return expires if current is None else min(current, expires)
+
+
+@contextmanager
+def _deadline_scope(expires):
+    """ Makes ``expires`` the deadline of the requests of the current thread within the block"""
+    previous = _current_deadline()
+    _local.deadline = expires
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def _map_concurrently(func, items, max_workers, expires=None):
+    """ Calls ``func`` for each of ``items`` using upto ``max_workers`` threads. Returns the results
+    in the order of ``items``, the error raised for an item (a :py:class:`NetflixError`, a ``requests``
+    error such as a dropped connection, a ``ValueError`` for a malformed response...) takes the place of
+    its result. The calls made after the deadline ``expires`` fail with :py:class:`DeadlineExceededError`"""
+    def call(item):
+        try:
+            with _deadline_scope(expires):
+                return func(item)
+        except Exception as e:
+            return e
+    items = list(items)
+    if len(items) <= 1 or max_workers <= 1:
+        return [call(item) for item in items]
+    pool = ThreadPool(min(max_workers, len(items)))
+    try:
+        return pool.map(call, items)
+    finally:
+        pool.close()
+
+def _response_bytes(response, stream):
+    """ Returns the size of the body of ``response``, ``None`` if it is streamed and of unknown length"""
+    if not stream:
+        return len(response.content)
+    length = response.headers.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+class _SingleFlight(object):
+    """ Lets concurrent calls made with the same key share the result of the first of them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """ Calls ``func`` unless a call with the same ``key`` is in progress, in which case its response
+        (or error) is waited for. Returns the tuple ``(response, shared)``, every caller gets its own copy
+        of the response"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+        if leader:
+            try:
+                call['response'] = func()
+                return call['response'], False
+            except:
+                call['error'] = sys.exc_info()
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call['done'].set()
+
+        expires = _current_deadline()
+        if not call['done'].wait(expires - time.time() if expires is not None else None):
+            raise DeadlineExceededError("Deadline exceeded waiting for the response of: {0}".format(key))
+        if 'error' in call:
+            error_type, error, traceback = call['error']
+            if issubclass(error_type, DeadlineExceededError):
+                # The deadline of the first caller passed, this one may still have time
+                return self.do(key, func)
+            raise error_type, error, traceback
+        return to_response(to_entry(call['response'])), True
+
+
+def _page_items(page, path):
+    """ Returns the list of items and the total number of results (``None`` if unknown) in a page
+    of results. ``path`` is the key(s) leading to the items, e.g. ``("catalog_titles", "catalog_title")``"""
+    total = page.get('number_of_results')
+    items = page
+    for key in path:
+        if isinstance(items, dict):
+            total = items.get('number_of_results', total)
+            items = items.get(key)
+    if not items:
+        items = []
+    elif isinstance(items, dict):
+        items = [items]
+    return items, int(total) if total is not None else None
+
+
+def _iter_pages(fetch, path, prefetch=False, page_size=MAX_PAGE_SIZE, expires=None):
+    """ Yields the items of all the pages of results, ``fetch(start_index, max_results)`` is called to get
+    a page. If ``prefetch`` is set the next page is fetched in background while the current one is consumed.
+    The pages fetched after the deadline ``expires`` fail with :py:class:`DeadlineExceededError`"""
+    if expires is not None:
+        fetch_page = fetch
+        def fetch(start_index, max_results):
+            with _deadline_scope(expires):
+                return fetch_page(start_index, max_results)
+    pool = ThreadPool(1) if prefetch else None
+    try:
+        start_index = 0
+        page = fetch(start_index, page_size)
+        while True:
+            items, total = _page_items(page, path)
+            start_index += len(items)
+            if total is not None:
+                has_more = bool(items) and start_index < total
+            else:
+                has_more = len(items) >= page_size
+            if has_more and pool:
+                pending = pool.apply_async(fetch, (start_index, page_size))
+            for item in items:
+                yield item
+            if not has_more:
+                return
+            page = pending.get() if pool else fetch(start_index, page_size)
+    finally:
+        if pool:
+            pool.terminate()
+
+
+def _merge_results(results):
+    """ Merges responses of the same resource into one, lists are concatenated in order while
+    for the other values the first response wins"""
+    merged = results[0]
+    for result in results[1:]:
+        if isinstance(merged, list) and isinstance(result, list):
+            merged = merged + result
+        elif isinstance(merged, dict) and isinstance(result, dict):
+            merged = dict(merged)
+            for key, value in result.items():
+                merged[key] = _merge_results([merged[key], value]) if key in merged else value
+    return merged
+
+
 class NetflixError(Exception):
     """ Error thrown if the netflix api throws http error"""
     pass
 
 
+class RateLimitError(NetflixError):
+    """ Error thrown if a request is over the rate limit, either of the client side
+    :py:class:`~pyflix2.ratelimit.RateLimiter` or of the netflix quotas"""
+    pass
+
+
+class CircuitOpenError(NetflixError):
+    """ Error thrown without making the request, while the :py:class:`~pyflix2.circuit.CircuitBreaker`
+    of its endpoint family is open because netflix is failing"""
+    pass
+
+
+class DeadlineExceededError(NetflixError):
+    """ Error thrown if the deadline of a call (see :py:meth:`~NetflixAPIV2.deadline`) passes before
+    the call could complete"""
+    pass
+
+
+class ReplayMissError(NetflixError):
+    """ Error thrown by :py:class:`~pyflix2.transport.ReplayTransport` for a request it has no
+    recorded response for"""
+    pass
+
+
 class NetflixAuthRequiredError(Exception):
     """ Error thrown if authorization is required"""
     pass
@@ -56,15 +275,53 @@ class _NetflixAPI(object):
     """ Abstract Class for the common api of Netflix V1.0 and V2.0"""
 
     _api_version = 2.0
+    _catalog_types = CATALOG_TYPES_V2
 
-    def __init__(self, appname, consumer_key, consumer_secret, logger=None):
+    def __init__(self, appname, consumer_key, consumer_secret, logger=None, cache=None, cache_ttl=3600,
+                 pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True, rate_limiter=None,
+                 retry=None, circuit_breaker=None, timeout=DEFAULT_TIMEOUT, coalesce=True,
+                 stale_while_revalidate=0, hooks=(), base_url=None, transport=None):
         """ **Abstract class** contains all the common functionality of netflix v1 and v2 REST api
 
         :param appname: The Application name as registered in Netflix Developer 
             website <http://developer.netflix.com/apps/mykeys>
         :param consumer_key: The consumer key as registered in Netlflix Developer website
         :param consumer_secret: The consumer secret as registerde in Netflix Developer website
-        :param logger: (Optional) The stream object to write log to. Nothing is logged if `logger` is `None`
+        :param logger: (Optional) The stream object to write log to, or a ``logging.Logger`` (requests are
+            logged at ``DEBUG`` level, retries at ``WARNING``). Nothing is logged if `logger` is `None`.
+            See :py:mod:`pyflix2.logs` for writing the log from a background thread
+        :param cache: (Optional) Cache for the responses of catalog GET requests, either a
+            :py:class:`~pyflix2.cache.MemoryCache`, a :py:class:`~pyflix2.cache.DiskCache` or any object
+            with the methods ``get(key)`` and ``set(key, entry, ttl)``. User specific requests are never cached
+        :param cache_ttl: (Optional) Number of seconds responses are cached for, unless their
+            ``Cache-Control`` header says otherwise
+        :param pool_connections: (Optional) The number of hosts connection pools are kept for
+        :param pool_maxsize: (Optional) The maximum number of connections kept open per host. The pool is
+            shared by all the :py:class:`User` objects of the client
+        :param pool_block: (Optional) If set, requests wait for a free connection once ``pool_maxsize``
+            connections are in use, instead of opening (and then discarding) extra connections
+        :param keep_alive: (Optional) If unset, connections are closed after each request
+        :param rate_limiter: (Optional) :py:class:`~pyflix2.ratelimit.RateLimiter` every request (of the
+            client and of its users) has to get past, :py:class:`RateLimitError` is raised for requests
+            it doesn't let through within its ``max_wait``
+        :param retry: (Optional) :py:class:`~pyflix2.retry.RetryPolicy` retrying the requests failing with
+            transient errors, or the maximum number of retries for a default policy. Nothing is retried by default
+        :param circuit_breaker: (Optional) :py:class:`~pyflix2.circuit.CircuitBreaker` failing the requests
+            of an endpoint family with :py:class:`CircuitOpenError` at once while netflix keeps failing them
+        :param timeout: (Optional) The timeout of each request in seconds, either a number or the tuple
+            ``(connect_timeout, read_timeout)``. ``None`` waits for netflix forever
+        :param coalesce: (Optional) If set, identical catalog requests made concurrently (e.g. many threads
+            calling :py:meth:`get_title` for the same title) are sent once and share the response
+        :param stale_while_revalidate: (Optional) The number of seconds a cached response is still served
+            for after it expired, while it is refreshed in background. By default expired responses are
+            fetched again before returning. A custom ``cache`` has to accept ``get(key, max_stale)`` for it
+        :param hooks: (Optional) List of :py:class:`~pyflix2.metrics.RequestHook` objects called before and
+            after each request, e.g. a :py:class:`~pyflix2.metrics.Metrics` aggregating latencies per endpoint
+        :param base_url: (Optional) The url of the api, :py:data:`BASE_URL` by default. Lets the client talk to
+            a stand-in server such as :py:class:`~pyflix2.fakeserver.FakeNetflixServer`
+        :param transport: (Optional) The ``requests`` adapter sending the requests, e.g. a
+            :py:class:`~pyflix2.transport.RecordingTransport` or :py:class:`~pyflix2.transport.ReplayTransport`.
+            The pool options don't apply to it
         """
 
         # Abstractify this class
@@ -80,11 +337,47 @@ class _NetflixAPI(object):
         self._consumer_key = consumer_key.strip()
         self._consumer_secret = consumer_secret.strip()
 
-        oauth = OAuth1(self._consumer_key, client_secret=self._consumer_secret)
+        oauth = get_signer(self._consumer_key, self._consumer_secret)
         self._logger = logger
+        self._cache = cache
+        self._cache_ttl = cache_ttl
+        self._rate_limiter = rate_limiter
+        if isinstance(retry, (int, long)) and not isinstance(retry, bool):
+            retry = RetryPolicy(max_retries=retry)
+        self._retry = retry or None
+        self._circuit_breaker = circuit_breaker
+        self._timeout = timeout
+        self._single_flight = _SingleFlight() if coalesce else None
+        self._stale_while_revalidate = stale_while_revalidate
+        self._revalidating = set()
+        self._revalidate_lock = threading.Lock()
+        self._revalidate_pool = None
+        self._hooks = list(hooks)
+        self._base_url = base_url.rstrip('/') if base_url else None
 
         self._client = requests.Session()
         self._client.auth = oauth
+        adapter = transport or HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                           pool_block=pool_block)
+        self._client.mount('http://', adapter)
+        self._client.mount('https://', adapter)
+        if not keep_alive:
+            self._client.headers['Connection'] = 'close'
+
+    def deadline(self, seconds):
+        """ Returns a context manager bounding the time spent in the calls made within it, including
+        retries and waits for the rate limiter. The calls (of the client and of its users) still pending
+        once ``seconds`` have passed fail with :py:class:`DeadlineExceededError`::
+
+            with netflix.deadline(2.5):
+                title = netflix.get_title(id)
+                queue = user.get_queues_instant()
+
+        Deadlines nest, the inner block can't extend the deadline of the outer one.
+
+        :param seconds: The number of seconds the calls within the block have to complete in
+        """
+        return _deadline_scope(_expires(seconds))
 
     def get_request_token(self, use_OOB = True):
         """Obtains the request token/secret and the authentication URL
@@ -106,7 +399,8 @@ class _NetflixAPI(object):
             data = {u'oauth_callback': u'oob'}
         else:
             data = {}
-        response = requests.post(REQUEST_TOKEN_URL, auth=oauth, data=data, allow_redirects=True)
+        url = self._base_url + '/oauth/request_token' if self._base_url else REQUEST_TOKEN_URL
+        response = self._send("post", url, data, {}, oauth, False, _current_deadline())
         response = parse_qs(response.text)
         request_token = response['oauth_token'][0]
         request_secret = response['oauth_token_secret'][0]
@@ -147,7 +441,8 @@ class _NetflixAPI(object):
         else:
             oauth = OAuth1(self._consumer_key, client_secret=self._consumer_secret,  resource_owner_key=request_token,
                 resource_owner_secret=request_token_secret)
-        response = requests.post(ACCESS_TOKEN_URL, auth=oauth)
+        url = self._base_url + '/oauth/access_token' if self._base_url else ACCESS_TOKEN_URL
+        response = self._send("post", url, {}, {}, oauth, False, _current_deadline())
 
         response = parse_qs(response.text)
         return response[u'user_id'][0], response[u'oauth_token'][0], response[u'oauth_token_secret'][0]
@@ -235,6 +530,23 @@ class _NetflixAPI(object):
         else:
             raise NetflixError("The id should be like: http://api.netflix.com/catalog/movies/60000870")
 
+    def get_titles(self, ids, category=None, max_workers=10, deadline=None):
+        """ Retrieve details for many catalog titles at once, fetching upto ``max_workers`` of them concurrently
+
+        :param ids: List of title ids, see :py:meth:`get_title`
+        :param category: (Optional) Same as ``category`` of :py:meth:`get_title`, fetched for every title
+        :param max_workers: (Optional) The maximum number of requests in flight at a time
+        :param deadline: (Optional) The number of seconds all the titles have to be fetched in, the
+            titles not fetched in time fail with :py:class:`DeadlineExceededError`
+
+        :returns:
+            List with the details of each title in the order of ``ids``. If fetching a title fails the
+            :py:class:`NetflixError` (or the ``requests`` error if no response was received, the ``ValueError``
+            if the response is malformed) is put in its place, the rest of the titles are still fetched
+        :rtype: list
+        """
+        return _map_concurrently(lambda id: self.get_title(id, category), ids, max_workers, _expires(deadline))
+
     def search_people(self, term, start_index=None, max_results=None):
         """search for people in the catalog by their name or a portion of their name.
 
@@ -254,6 +566,18 @@ class _NetflixAPI(object):
                      'start_index': start_index, 'max_results': max_results}
         return self._request("get", url_path, data).json()
 
+    def iter_search_people(self, term, prefetch=False, deadline=None):
+        """ Same as :py:meth:`search_people`, but yields the people of all the pages of results,
+        fetching the pages lazily
+
+        :param term: The term in the person's name to search for in the catalog.
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        fetch = lambda start_index, max_results: self.search_people(term, start_index=start_index,
+                                                                    max_results=max_results)
+        return _iter_pages(fetch, ('people', 'person'), prefetch, expires=_expires(deadline))
+
     def get_person(self, id):
         """ You can retrieve detailed information about a person in the Catalog, using that person's ID,
         that includes a biography, featured titles, and a complete list of titles
@@ -272,6 +596,21 @@ class _NetflixAPI(object):
         else:
             raise NetflixError("The id should be like: http://api.netflix.com/catalog/people/185930")
 
+    def get_people(self, ids, max_workers=10, deadline=None):
+        """ Retrieve details for many people at once, fetching upto ``max_workers`` of them concurrently
+
+        :param ids: List of person ids, see :py:meth:`get_person`
+        :param max_workers: (Optional) The maximum number of requests in flight at a time
+        :param deadline: (Optional) The number of seconds all the people have to be fetched in
+
+        :returns:
+            List with the details of each person in the order of ``ids``. If fetching a person fails the
+            :py:class:`NetflixError` (or the ``requests`` error if no response was received, the ``ValueError``
+            if the response is malformed) is put in its place, the rest are still fetched
+        :rtype: list
+        """
+        return _map_concurrently(self.get_person, ids, max_workers, _expires(deadline))
+
 
     def get_user(self, user_id, user_token, user_token_secret):
         """ Returns the user object, which could then be used to make further user specific calls 
@@ -287,6 +626,167 @@ class _NetflixAPI(object):
         return user
 
 
+    def download_catalog(self, path, catalog_type=None, chunk_size=64 * 1024, max_retries=5):
+        """Downloads the complete catalog into a file, resuming the transfer if it gets interrupted
+
+        The catalog is written to ``path + ".part"`` as it arrives, along with a checkpoint file
+        (``path + ".part.json"``) recording the ``ETag`` and size of the catalog. If the connection
+        drops (or a previous call was interrupted) the download is resumed from where it stopped using
+        ``Range``/``If-Range`` requests. Once complete, the size of the file is verified and it is moved to ``path``,
+        the checkpoint is kept as ``path + ".json"`` for use by :py:meth:`sync_catalog`.
+
+        The catalog is saved as sent by netflix (usually gzip compressed), it can be parsed using
+        :py:func:`pyflix2.catalog.iter_titles`
+
+        :param path: The file to save the catalog to
+        :param catalog_type: (Optional) The type of catalog to fetch, defaults to the complete catalog
+            see :py:data:`CATALOG_TYPES_V2`/:py:data:`CATALOG_TYPES_V1`
+        :param chunk_size: (Optional) The number of bytes read from the network at a time
+        :param max_retries: (Optional) The number of times an interrupted download (or one failing with
+            a 5xx error) is resumed before giving up, with an exponential backoff between the attempts
+
+        :returns: path of the downloaded catalog
+        """
+        url_path = self._catalog_path(catalog_type or self._catalog_types[0])
+        self._download_catalog(url_path, path, {}, chunk_size, max_retries)
+        return path
+
+    def sync_catalog(self, path, catalog_type=None, chunk_size=64 * 1024, max_retries=5):
+        """Refreshes a catalog previously saved using :py:meth:`download_catalog` (or this method), the
+        catalog is downloaded again only if it has changed on the server.
+
+        The ``ETag``/``Last-Modified`` of the saved catalog are kept in ``path + ".json"`` and sent
+        as ``If-None-Match``/``If-Modified-Since``, so an unchanged catalog costs a single round trip.
+        If ``path`` doesn't exist yet the catalog is downloaded.
+
+        :param path: The file the catalog is saved to
+        :param catalog_type: (Optional) The type of catalog to fetch, defaults to the complete catalog
+            see :py:data:`CATALOG_TYPES_V2`/:py:data:`CATALOG_TYPES_V1`
+        :param chunk_size: (Optional) The number of bytes read from the network at a time
+        :param max_retries: (Optional) The number of times an interrupted download is resumed before giving up
+
+        :returns: ``True`` if a new catalog was downloaded, ``False`` if the saved one is up to date
+        :rtype: bool
+        """
+        url_path = self._catalog_path(catalog_type or self._catalog_types[0])
+        headers = {}
+        if os.path.exists(path) and os.path.exists(path + '.json'):
+            with open(path + '.json') as f:
+                validators = json.load(f)
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        return self._download_catalog(url_path, path, headers, chunk_size, max_retries)
+
+    def _download_catalog(self, url_path, path, conditional_headers, chunk_size, max_retries):
+        """ Downloads the catalog into ``path`` keeping the validators of the catalog in ``path + ".json"``.
+        Returns False if the server responded that the catalog is not modified"""
+        part_path = path + '.part'
+        checkpoint_path = part_path + '.json'
+        attempt = 0
+        while True:
+            try:
+                status, total = self._download_catalog_part(url_path, part_path, checkpoint_path,
+                                                            chunk_size, conditional_headers)
+            except _TRANSFER_ERRORS as e:
+                error = e
+            else:
+                if status == 304:
+                    self._log("Catalog %s not modified", url_path, level=logging.INFO)
+                    return False
+                if status in RETRY_STATUSES:
+                    # The part downloaded so far is kept, the server may well be back on the next attempt
+                    error = "Server error %d" % status
+                else:
+                    size = os.path.getsize(part_path)
+                    if total is None or size == total:
+                        break
+                    if size > total:
+                        os.remove(part_path)
+                    error = "Received %d of %d bytes" % (size, total)
+            attempt += 1
+            if attempt > max_retries:
+                raise NetflixError("Couldn't download catalog after %d attempts: %s" % (attempt, error))
+            delay = self._resume_delay(attempt)
+            self._log("Catalog download interrupted, resuming (attempt %d) in %.2fs: %s", attempt, delay, error,
+                      level=logging.WARNING)
+            time.sleep(delay)
+
+        os.rename(part_path, path)
+        os.rename(checkpoint_path, path + '.json')
+        return True
+
+    def _resume_delay(self, attempt):
+        """ Returns how long to wait before resuming a catalog download for the ``attempt``-th time"""
+        if self._retry is not None:
+            return self._retry.backoff(attempt)
+        return min(_RESUME_BACKOFF * 2 ** (attempt - 1), _MAX_RESUME_BACKOFF)
+
+    def _download_catalog_part(self, url_path, part_path, checkpoint_path, chunk_size, conditional_headers):
+        """ Downloads the (rest of the) catalog into ``part_path``. Returns the response status and the
+        size of the catalog as reported by the server (``None`` if it is unknown). 5xx errors are returned
+        rather than raised, so that the download can be resumed"""
+        checkpoint = {}
+        offset = 0
+        if os.path.exists(part_path) and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            offset = os.path.getsize(part_path)
+        validator = checkpoint.get('etag') or checkpoint.get('last_modified')
+        if offset and offset == checkpoint.get('total'):
+            return 206, offset
+
+        headers = {'Accept-Encoding': 'gzip'}
+        if offset and validator:
+            headers['Range'] = 'bytes=%d-' % offset
+            headers['If-Range'] = validator
+        else:
+            headers.update(conditional_headers)
+        # A catalog changed since the partial download fails the Range request with 412/416 (or is sent
+        # whole with a 200)
+        resumable = 'Range' in headers
+        resp = self._request("get", url_path, headers=headers, data={'output': None}, stream=True,
+                             ok_status=(304,) + RETRY_STATUSES + ((412, 416) if resumable else ()))
+        if resp.status_code in (412, 416):
+            resp.close()
+            self._log("Couldn't resume catalog download from byte %d, restarting", offset, level=logging.WARNING)
+            os.remove(part_path)
+            return self._download_catalog_part(url_path, part_path, checkpoint_path, chunk_size,
+                                               conditional_headers)
+        if resp.status_code == 304 or resp.status_code in RETRY_STATUSES:
+            resp.close()
+            return resp.status_code, None
+        if resp.status_code == 206:
+            mode = 'ab'
+            total = resp.headers.get('Content-Range', '').rpartition('/')[2]
+        else:
+            mode = 'wb'
+            total = resp.headers.get('Content-Length')
+        total = int(total) if total and total.isdigit() else None
+        checkpoint = {'etag': resp.headers.get('ETag'),
+                      'last_modified': resp.headers.get('Last-Modified'),
+                      'total': total}
+        with open(checkpoint_path, 'w') as f:
+            json.dump(checkpoint, f)
+
+        try:
+            with open(part_path, mode) as f:
+                while True:
+                    # Read the bytes as sent, so the offsets match those of the Range requests
+                    chunk = resp.raw.read(chunk_size, decode_content=False)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        finally:
+            resp.close()
+        return resp.status_code, total
+
+    def _catalog_path(self, catalog_type):
+        if catalog_type not in self._catalog_types:
+            raise NetflixError("Invalid catalog type")
+        return '/catalog/titles/%s' % catalog_type
+
     def _assert_authorized(self):
         if not self._user_credential_set:
             raise NetflixAuthRequiredError("User is not authorized")
@@ -310,16 +810,25 @@ class _NetflixAPI(object):
         url = urlunparse(url_parts)
         return url
 
-    def _log(self, msg):
+    def _log(self, msg, *args, **fields):
+        """ Logs ``msg % args``. The message is only formatted if it is going to be written, i.e. a logger
+        is set and (for a ``logging.Logger``) the ``level`` (default ``DEBUG``) is enabled. The other
+        keyword arguments are set as attributes of the ``logging`` record, for structured formatters"""
+        logger = self._logger
+        if not logger:
+            return
+        level = fields.pop('level', logging.DEBUG)
         try:
-            if self._logger:
-                self._logger.write('%s   %s\n' % (
-                    datetime.now().isoformat(), msg))
+            if isinstance(logger, logging.Logger):
+                if logger.isEnabledFor(level):
+                    logger.log(level, msg, *args, extra=fields)
+            else:
+                logger.write('%s   %s\n' % (datetime.now().isoformat(), msg % args if args else msg))
         except:
             print "Caught exception [%s] while trying to log msg, \
                                   ignored: %s" % (sys.exc_info()[0], msg)
 
-    def _request(self, method, url, data={}, headers={}, client=None, stream=False):
+    def _request(self, method, url, data={}, headers={}, auth=None, stream=False, ok_status=()):
         """
         """
         if self._api_version == 2.0:
@@ -334,32 +843,234 @@ class _NetflixAPI(object):
                 del data[k]
 
         if not url.startswith('http'):
-            url = "%s%s" % (BASE_URL, url)
+            url = "%s%s" % (self._base_url or BASE_URL, url)
 
-        if not client:
-            client = self._client
+        if not self._hooks:
+            return self._dispatch(method, url, data, headers, auth, stream, ok_status)
 
-        if method is "get":
-            r = client.request(method, url, params=data, headers=headers, allow_redirects=True, stream=stream)
-        else:
-            r = client.request(method, url, data=data, headers=headers, allow_redirects=True, stream=stream)
-
-        self._log((r.request.method, r.url, r.status_code))
-        if r.status_code < 200 or r.status_code >= 300:
+        event = {'method': method.upper(), 'url': url, 'endpoint': endpoint_template(url), 'cache': None,
+                 'coalesced': False, 'retries': 0, 'status': None, 'request_bytes': None, 'response_bytes': None}
+        self._call_hooks('before_request', event)
+        started = time.time()
+        error = None
+        try:
+            r = self._dispatch(method, url, data, headers, auth, stream, ok_status, event)
+            event['status'] = r.status_code
+            event['response_bytes'] = _response_bytes(r, stream)
+            return r
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            event['elapsed'] = time.time() - started
+            event['error'] = error
+            self._call_hooks('after_request', event)
+
+    def _call_hooks(self, name, event):
+        for hook in self._hooks:
+            try:
+                getattr(hook, name)(event)
+            except Exception as e:
+                self._log("Caught exception [%r] in %s hook of %r, ignored", e, name, hook, level=logging.ERROR)
+
+    def _dispatch(self, method, url, data, headers, auth, stream, ok_status, event=None):
+        """ Answers the request from the cache or from an identical request in flight, else fetches it.
+        Notes where the response came from in ``event``"""
+        key = None
+        fetch = lambda event=None: self._fetch(method, url, data, headers, auth, stream, ok_status, key, event)
+        if self._cache is not None and self._is_cacheable(method, url, auth, stream):
+            key = cache_key(method, url, data)
+            if self._stale_while_revalidate:
+                entry = self._cache.get(key, max_stale=self._stale_while_revalidate)
+            else:
+                entry = self._cache.get(key)
+            cache_status = 'miss'
+            if entry is not None:
+                # Entries of custom caches may have no expiry, they are fresh as long as the cache returns them
+                expires = entry.get('expires')
+                if expires is not None and expires <= time.time():
+                    cache_status = 'stale'
+                    self._log("STALE %s %s", url, entry['status'], url=url, status=entry['status'], cache='stale')
+                    self._revalidate(key, fetch)
+                else:
+                    cache_status = 'hit'
+                    self._log("CACHED %s %s", url, entry['status'], url=url, status=entry['status'], cache='hit')
+            if event is not None:
+                event['cache'] = cache_status
+            if entry is not None:
+                return to_response(entry)
+
+        if self._single_flight is not None and not headers and self._is_cacheable(method, url, auth, stream):
+            # Identical catalog requests made at the same time share one response
+            response, shared = self._single_flight.do(key or cache_key(method, url, data), lambda: fetch(event))
+            if shared:
+                self._log("COALESCED %s %s", url, response.status_code, url=url, status=response.status_code)
+                if event is not None:
+                    event['coalesced'] = True
+            return response
+        return fetch(event)
+
+    def _fetch(self, method, url, data, headers, auth, stream, ok_status, key, event=None):
+        """ Makes the request, retrying it as per the retry policy, and caches the response under ``key``.
+        Notes the number of retries, the status and the request size in ``event``"""
+        expires = _current_deadline()
+        if self._retry is not None:
+            self._retry.start()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                r = self._send(method, url, data, headers, auth, stream, expires)
+            except requests.exceptions.RequestException as e:
+                delay = self._retry_delay(method, url, attempt, expires, error=e)
+                if delay is None:
+                    raise
+                self._log("RETRY %s %s attempt %d after %r in %.2fs", method.upper(), url, attempt, e, delay,
+                          level=logging.WARNING, method=method.upper(), url=url, attempt=attempt, delay=delay)
+                time.sleep(delay)
+                continue
+            if (200 <= r.status_code < 300) or r.status_code in ok_status:
+                break
+            delay = self._retry_delay(method, url, attempt, expires, response=r)
+            if delay is None:
+                break
+            self._log("RETRY %s %s attempt %d after %s in %.2fs", method.upper(), url, attempt, r.status_code, delay,
+                      level=logging.WARNING, method=method.upper(), url=url, attempt=attempt, delay=delay,
+                      status=r.status_code)
+            r.close()
+            time.sleep(delay)
+
+        if event is not None:
+            event['retries'] = attempt - 1
+            event['status'] = r.status_code
+            event['request_bytes'] = len(r.request.url) + len(r.request.body or '')
+
+        if (r.status_code < 200 or r.status_code >= 300) and r.status_code not in ok_status:
             error = {}
             try:
                 error = json.loads(r.content or r.text)
             except:
-                self._log("Couldn't jsonify error response: %s" % (r.content or r.text))
+                self._log("Couldn't jsonify error response: %s", r.content or r.text)
+            if r.headers.get('X-Mashery-Error-Code') in _QUOTA_ERROR_CODES:
+                raise RateLimitError("Netflix quota exceeded fetching url: {0}. Code: {1}. Error: {2} "
+                        .format(r.url, r.status_code, r.content), error)
             raise NetflixError("Error fetching url: {0}. Code: {1}. Error: {2} "
                     .format(r.url, r.status_code, r.content), error)
+        if key is not None:
+            ttl = cache_ttl(r, self._cache_ttl)
+            if ttl > 0:
+                self._cache.set(key, to_entry(r), ttl)
         return r
 
+    def _revalidate(self, key, fetch):
+        """ Refreshes the cache entry under ``key`` in background, unless it is already being refreshed"""
+        with self._revalidate_lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+            if self._revalidate_pool is None:
+                self._revalidate_pool = ThreadPool(MAX_REVALIDATIONS)
+
+        def refresh():
+            try:
+                # Not bound by the deadline of the call which found the entry stale
+                with _deadline_scope(None):
+                    fetch()
+            except Exception as e:
+                self._log("Couldn't revalidate %s, ignored: %r", key, e, level=logging.WARNING)
+            finally:
+                with self._revalidate_lock:
+                    self._revalidating.discard(key)
+        self._revalidate_pool.apply_async(refresh)
+
+    def _retry_delay(self, method, url, attempt, expires, response=None, error=None):
+        """ Returns how long to wait before retrying a failed attempt, ``None`` if it isn't retried"""
+        if self._retry is None:
+            return None
+        delay = self._retry.next_delay(method, url, attempt, response=response, error=error)
+        if delay is not None and expires is not None and time.time() + delay >= expires:
+            # The retry couldn't complete before the deadline
+            return None
+        return delay
+
+    def _attempt_timeout(self, url, expires):
+        """ Returns the timeout of a request to ``url``, capped so that it doesn't outlast the deadline"""
+        if expires is None:
+            return self._timeout
+        remaining = expires - time.time()
+        if remaining <= 0:
+            raise DeadlineExceededError("Deadline exceeded, couldn't fetch url: {0}".format(url))
+        if self._timeout is None:
+            return remaining
+        if isinstance(self._timeout, tuple):
+            return tuple(min(timeout, remaining) if timeout is not None else remaining for timeout in self._timeout)
+        return min(self._timeout, remaining)
+
+    def _send(self, method, url, data, headers, auth, stream, expires=None):
+        """ Makes a single attempt of the request, once the rate limiter lets it through"""
+        if self._rate_limiter is not None:
+            wait = self._rate_limiter.max_wait
+            if expires is not None:
+                # Don't wait for the rate limiter past the deadline
+                remaining = max(expires - time.time(), 0)
+                wait = remaining if wait is None else min(wait, remaining)
+            if not self._rate_limiter.acquire(timeout=wait):
+                if expires is not None and time.time() + self._rate_limiter.wait_time() >= expires:
+                    raise DeadlineExceededError("Deadline exceeded waiting for the rate limiter, couldn't fetch url: {0}"
+                            .format(url))
+                raise RateLimitError("Rate limit exceeded, couldn't fetch url: {0}. Remaining: {1}"
+                        .format(url, self._rate_limiter.remaining()))
+        timeout = self._attempt_timeout(url, expires)
+        # If the timeout is shortened to meet the deadline, timing out means missing the deadline
+        capped = expires is not None and timeout != self._timeout
+
+        breaker = self._circuit_breaker
+        if breaker is not None:
+            family = endpoint_family(url)
+            if not breaker.allow(family):
+                raise CircuitOpenError("Circuit open for the {0} endpoints, couldn't fetch url: {1}. Retry in {2:.1f}s"
+                        .format(family, url, breaker.retry_in(family)))
+            started = time.time()
+
+        try:
+            if method is "get":
+                r = self._client.request(method, url, params=data, headers=headers, auth=auth,
+                                         allow_redirects=True, stream=stream, timeout=timeout)
+            else:
+                r = self._client.request(method, url, data=data, headers=headers, auth=auth,
+                                         allow_redirects=True, stream=stream, timeout=timeout)
+        except:
+            # A timeout shortened to meet the deadline of the caller isn't a failure of netflix
+            deadline_exceeded = capped and isinstance(sys.exc_info()[1], requests.exceptions.Timeout)
+            if breaker is not None:
+                if deadline_exceeded:
+                    breaker.cancel(family)
+                else:
+                    breaker.record(family, True, time.time() - started)
+            if deadline_exceeded:
+                raise DeadlineExceededError("Deadline exceeded fetching url: {0}".format(url))
+            raise
+        if breaker is not None:
+            breaker.record(family, r.status_code >= 500, time.time() - started)
+
+        self._log("%s %s %s", r.request.method, r.url, r.status_code,
+                  method=r.request.method, url=r.url, status=r.status_code)
+        return r
+
+    @staticmethod
+    def _is_cacheable(method, url, auth, stream):
+        """ Only catalog GETs made with the application credentials are cached"""
+        path = urlparse(url).path
+        return (method == "get" and not auth and not stream and
+                not path.startswith('/users') and not path.startswith('/oauth'))
+
 
 class NetflixAPIV1(_NetflixAPI):
     """ Provides functional interface to Netflix V1 REST api"""
 
-    def __init__(self, appname, consumer_key, consumer_secret, logger=None):
+    _catalog_types = CATALOG_TYPES_V1
+
+    def __init__(self, appname, consumer_key, consumer_secret, logger=None, **options):
         """ The main class for accessing the Netflix REST API v1.0 http://developer.netflix.com/docs/REST_API_Reference
         It provides all the methods needed to access the resources exposed by netflix. Netflix has now released version 2.0
         http://developer.netflix.com/page/Netflix_API_20_Release_Notes which is backward incompatible. So going forward netflix
@@ -370,9 +1081,15 @@ class NetflixAPIV1(_NetflixAPI):
         :param consumer_key: The consumer key as registered in Netlflix Developer website
         :param consumer_secret: The consumer secret as registered in Netflix Developer website
             three legged authentication 
-        :param logger: (Optional) The stream object to write log to. Nothing is logged if `logger` is `None`
+        :param logger: (Optional) The stream object to write log to, or a ``logging.Logger`` (requests are
+            logged at ``DEBUG`` level, retries at ``WARNING``). Nothing is logged if `logger` is `None`.
+            See :py:mod:`pyflix2.logs` for writing the log from a background thread
+        :param options: (Optional) Further client options: ``cache``, ``cache_ttl``, ``pool_connections``,
+            ``pool_maxsize``, ``pool_block``, ``keep_alive``, ``rate_limiter``, ``retry``,
+            ``circuit_breaker``, ``timeout``, ``coalesce``, ``stale_while_revalidate``,
+            ``hooks``, ``base_url``, ``transport``
         """
-        super(NetflixAPIV1, self).__init__(appname, consumer_key, consumer_secret, logger)
+        super(NetflixAPIV1, self).__init__(appname, consumer_key, consumer_secret, logger, **options)
         self._api_version = 1.0
 
     def search_titles(self, term, start_index=0, max_results=25):
@@ -395,6 +1112,18 @@ class NetflixAPIV1(_NetflixAPI):
         """
         return super(NetflixAPIV1, self).search_titles(term, start_index=start_index, max_results = max_results)
 
+    def iter_search_titles(self, term, prefetch=False, deadline=None):
+        """ Same as :py:meth:`search_titles`, but yields the titles of all the pages of results,
+        fetching the pages lazily
+
+        :param term: The word or term to search the catalog for.
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        fetch = lambda start_index, max_results: self.search_titles(term, start_index=start_index,
+                                                                    max_results=max_results)
+        return _iter_pages(fetch, ('catalog_titles', 'catalog_title'), prefetch, expires=_expires(deadline))
+
     def title_autocomplete(self, term, start_index=None, max_results=None):
         """ Searches the catalog for  for movies and television series whose "short" 
         titles match a partial search text. You can then pass the title names that 
@@ -423,14 +1152,17 @@ class NetflixAPIV1(_NetflixAPI):
         for movie in search_result['catalog_titles']['catalog_title']:
             title = movie['title']['regular']
             if movie_title.lower() == title.lower():
-                self._log("Found movie: '%s' id: '%s'" % (title, movie['id']))
+                self._log("Found movie: '%s' id: '%s'", title, movie['id'])
                 return movie
         return None
 
-    def get_catalog(self, catalog_type='index', chunk_size=4096, raw=False):
+    def get_catalog(self, catalog_type='index', chunk_size=4096, raw=False, parse=False):
         """Retrieve a complete index of all instant-watch titles in the Netflix catalog
 
         :param catalog_type: The type of catalog to fetch; see :py:data:`CATALOG_TYPES_V1`
+        :param chunk_size: The number of bytes read from the network at a time
+        :param raw: (Optional) If set the underlying raw response stream is returned
+        :param parse: (Optional) If set the catalog is decompressed and parsed incrementally
 
         URLs: 
             /catalog/titles/index
@@ -438,21 +1170,25 @@ class NetflixAPIV1(_NetflixAPI):
             /catalog/titles/dvd
 
         :Returns:
-            Returns an iter object which can be written to disk etc
+            Returns an iter object which can be written to disk etc. If ``parse`` is set, returns
+            a generator yielding one title record (``dict``) at a time, memory usage stays flat
+            irrespective of the size of the catalog
         """
-        if not CATALOG_TYPES_V1.index(catalog_type):
-            raise NetflixError("Invalid catalog type")
-
-        url_path = '/catalog/titles/%s' % catalog_type
+        url_path = self._catalog_path(catalog_type)
         resp = self._request("get", url_path, headers={'Accept-Encoding': 'gzip'}, data={'output': None}, stream=True)
         if raw:
             return resp.raw
+        if parse:
+            return iter_titles(resp.iter_content(chunk_size))
         return resp.iter_content(chunk_size)
 
 class NetflixAPIV2(_NetflixAPI):
     """ Provides functional interface to Netflix V2 REST api"""
 
-    def __init__(self, appname, consumer_key, consumer_secret, access_token=None, logger=None):
+    _catalog_types = CATALOG_TYPES_V2
+
+    def __init__(self, appname, consumer_key, consumer_secret, access_token=None, logger=None, title_index=None,
+                 autocomplete_index=None, **options):
         """ The main class for accessing the Netflix REST API v2.0 http://developer.netflix.com/page/Netflix_API_20_Release_Notes
         It provides all the methods needed to access the resources exposed by netflix. The version 2.0 of the API 
         is backward incompitable. So going forward netflix may *deprectate* the version 1.0 APIs. So it is 
@@ -462,10 +1198,23 @@ class NetflixAPIV2(_NetflixAPI):
             website <http://developer.netflix.com/apps/mykeys>
         :param consumer_key: The consumer key as registered in Netlflix Developer website
         :param consumer_secret: The consumer secret as registerde in Netflix Developer website
-        :param logger: (Optional) The stream object to write log to. Nothing is logged if `logger` is `None`
+        :param logger: (Optional) The stream object to write log to, or a ``logging.Logger`` (requests are
+            logged at ``DEBUG`` level, retries at ``WARNING``). Nothing is logged if `logger` is `None`.
+            See :py:mod:`pyflix2.logs` for writing the log from a background thread
+        :param title_index: (Optional) A :py:class:`~pyflix2.index.TitleIndex` built from the catalog. If given
+            :py:meth:`search_titles`, :py:meth:`get_title` and :py:meth:`get_movie_by_title` are answered
+            from it, only queries it can't answer (``filter``/``expand``/``category``, unknown ids) go to netflix
+        :param autocomplete_index: (Optional) A :py:class:`~pyflix2.index.AutocompleteIndex` built from the
+            catalog. If given :py:meth:`title_autocomplete` is answered from it
+        :param options: (Optional) Further client options: ``cache``, ``cache_ttl``, ``pool_connections``,
+            ``pool_maxsize``, ``pool_block``, ``keep_alive``, ``rate_limiter``, ``retry``,
+            ``circuit_breaker``, ``timeout``, ``coalesce``, ``stale_while_revalidate``,
+            ``hooks``, ``base_url``, ``transport``
         """
-        super(NetflixAPIV2, self).__init__(appname, consumer_key, consumer_secret, logger)
+        super(NetflixAPIV2, self).__init__(appname, consumer_key, consumer_secret, logger, **options)
         self._api_version = 2.0
+        self._title_index = title_index
+        self._autocomplete_index = autocomplete_index
 
     def search_titles(self, term, filter=None, expand=None, start_index=0, max_results=25):
         """Use the catalog titles resource to search the netflix movie catalog(includes all medium)
@@ -488,9 +1237,45 @@ class NetflixAPIV2(_NetflixAPI):
             and the total number of results in ``results_per_page``.
         :rtype: dict
         """
+        if self._title_index and not filter and not expand:
+            return self._title_index.search_titles(term, start_index=start_index, max_results=max_results)
         return super(NetflixAPIV2, self).search_titles(term, filter=filter, expand=expand, start_index=start_index,
                                                   max_results = max_results)
 
+    def iter_search_titles(self, term, filter=None, expand=None, prefetch=False, deadline=None):
+        """ Same as :py:meth:`search_titles`, but yields the titles of all the pages of results,
+        fetching the pages lazily
+
+        :param term: The word or term to search the catalog for.
+        :param filter: (Optional) The filter could be either the string `"instant"` or `"disc"`
+        :param expand: (Optional) see :py:data:`EXPANDS`
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        fetch = lambda start_index, max_results: self.search_titles(term, filter=filter, expand=expand,
+                                                                    start_index=start_index, max_results=max_results)
+        return _iter_pages(fetch, ('catalog', 'catalog_title'), prefetch, expires=_expires(deadline))
+
+    def get_title(self, id, category=None):
+        """ Retrieve details for specific catalog title
+
+        url: /catalog/titles/movies/title_id, /catalog/titles/series/series_id, /catalog/titles/series/series_id/seasons/season_id, /catalog/titles/programs/program_id
+
+        :param id: This is the id that is returned for movies in ``search_movie`` call (id looks like
+            ``http://api.netflix.com/catalog/titles/movies/60000870``)
+        :param category: The expand parameter instructs the API to get (``"title", "box_art"``,
+            see :py:data:`EXPANDS` without the `@` though)  information of the movie
+
+        :returns:
+            The detail of the movie **OR** (award/category..) etc of the movie as mentioned by category.
+            If the client has a ``title_index`` the title is answered from it
+        """
+        if self._title_index and not category:
+            title = self._title_index.get_title(id)
+            if title is not None:
+                return title
+        return super(NetflixAPIV2, self).get_title(id, category)
+
     def title_autocomplete(self, term, filter=None, start_index=None, max_results=None):
         """ Searches the catalog for  for movies and television series whose "short" 
         titles match a partial search text. You can then pass the title names that 
@@ -508,6 +1293,9 @@ class NetflixAPIV2(_NetflixAPI):
         :Returns:
              Returns a list of movie and television title names that match your partial search text. 
         """
+        if self._autocomplete_index:
+            return self._autocomplete_index.title_autocomplete(term, filter=filter, start_index=start_index,
+                                                               max_results=max_results)
         return super(NetflixAPIV2, self).title_autocomplete(term, filter=filter, start_index=start_index,
                                                   max_results = max_results)
     def get_movie_by_title(self, movie_title, filter=None):
@@ -521,14 +1309,17 @@ class NetflixAPIV2(_NetflixAPI):
         for movie in search_result['catalog']:
             title = movie['title']
             if movie_title.lower() == title.lower():
-                self._log("Found movie: '%s' id: '%s'" % (title, movie['id']))
+                self._log("Found movie: '%s' id: '%s'", title, movie['id'])
                 return movie
         return None
 
-    def get_catalog(self, catalog_type='full', chunk_size=4096, raw=False):
+    def get_catalog(self, catalog_type='full', chunk_size=4096, raw=False, parse=False):
         """Retrieve a complete index of all instant-watch/dvd titles in the Netflix catalog
 
         :param catalog_type: The type of catalog to fetch; see :py:data:`CATALOG_TYPES_V2`
+        :param chunk_size: The number of bytes read from the network at a time
+        :param raw: (Optional) If set the underlying raw response stream is returned
+        :param parse: (Optional) If set the catalog is decompressed and parsed incrementally
 
         URLs:
             /catalog/titles/full
@@ -536,17 +1327,16 @@ class NetflixAPIV2(_NetflixAPI):
             /catalog/titles/dvd
 
         :Returns:
-            Returns an iter object which can be written to disk etc
+            Returns an iter object which can be written to disk etc. If ``parse`` is set, returns
+            a generator yielding one title record (``dict``) at a time, memory usage stays flat
+            irrespective of the size of the catalog
         """
-        try:
-            is_valid = CATALOG_TYPES_V2.index(catalog_type)
-        except ValueError:
-            raise NetflixError("Invalid catalog type")
-
-        url_path = '/catalog/titles/%s' % catalog_type
+        url_path = self._catalog_path(catalog_type)
         resp = self._request("get", url_path, headers={'Accept-Encoding': 'gzip'}, data={'output': None}, stream=True)
         if raw:
             return resp.raw
+        if parse:
+            return iter_titles(resp.iter_content(chunk_size))
         return resp.iter_content(chunk_size)
 
 class User:
@@ -567,10 +1357,9 @@ class User:
         self._netflix_client = netflix_client
         self._access_token = access_token.strip()
         self._access_token_secret = access_token_secret.strip()
-        oauth = OAuth1(netflix_client._consumer_key, client_secret=netflix_client._consumer_secret,  resource_owner_key=self._access_token,
-            resource_owner_secret=self._access_token_secret, signature_type='query')
-        self._client = requests.Session()
-        self._client.auth = oauth
+        # Requests of the user go through the connection pool of the client, signed with the user's credentials
+        self._auth = get_signer(netflix_client._consumer_key, netflix_client._consumer_secret, self._access_token,
+            self._access_token_secret, signature_type='query')
         self.id = user_id
 
     def get_details(self):
@@ -651,6 +1440,59 @@ class User:
         return self._request_queue("get", '/users/' + self.id + "/queues/disc",
                                     expand, sort_order, start_index, max_results, updated_min)
 
+    def iter_queues(self, expand=None, sort_order=None, updated_min=None, prefetch=False, deadline=None):
+        """ Same as :py:meth:`get_queues`, but yields the entries of all the pages of the queue,
+        fetching the pages lazily
+
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        return self._iter_queue(self.get_queues, expand, sort_order, updated_min, prefetch, deadline)
+
+    def iter_queues_instant(self, expand=None, sort_order=None, updated_min=None, prefetch=False, deadline=None):
+        """ Same as :py:meth:`get_queues_instant`, but yields the entries of all the pages of the queue,
+        fetching the pages lazily
+
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        return self._iter_queue(self.get_queues_instant, expand, sort_order, updated_min, prefetch, deadline)
+
+    def iter_queues_disc(self, expand=None, sort_order=None, updated_min=None, prefetch=False, deadline=None):
+        """ Same as :py:meth:`get_queues_disc`, but yields the entries of all the pages of the queue,
+        fetching the pages lazily
+
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        return self._iter_queue(self.get_queues_disc, expand, sort_order, updated_min, prefetch, deadline)
+
+    def iter_queues_instant_available(self, sort_order=None, updated_min=None, prefetch=False, deadline=None):
+        """ Same as :py:meth:`get_queues_instant_available`, but yields the entries of all the pages of the
+        queue, fetching the pages lazily
+
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        # The available queue has no expand parameter
+        get_queue = lambda expand, **params: self.get_queues_instant_available(**params)
+        return self._iter_queue(get_queue, None, sort_order, updated_min, prefetch, deadline)
+
+    def iter_queues_instant_saved(self, expand=None, sort_order=None, updated_min=None, prefetch=False,
+                                  deadline=None):
+        """ Same as :py:meth:`get_queues_instant_saved`, but yields the entries of all the pages of the
+        queue, fetching the pages lazily
+
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        return self._iter_queue(self.get_queues_instant_saved, expand, sort_order, updated_min, prefetch, deadline)
+
+    def _iter_queue(self, get_queue, expand, sort_order, updated_min, prefetch, deadline):
+        fetch = lambda start_index, max_results: get_queue(expand=expand, sort_order=sort_order, start_index=start_index,
+                                                           max_results=max_results, updated_min=updated_min)
+        return _iter_pages(fetch, ('queue', 'queue_item'), prefetch, expires=_expires(deadline))
+
     def add_queue_instant(self, title_ref, position, etag):
         """These resources automatically add the title to the saved or available queue, 
         depending on the title's availability. Use :py:meth:`~User.get_title_states`
@@ -672,7 +1514,7 @@ class User:
             response includes a new ETag value that you can then use in subsequent requests.
         """
         data = {'title_ref': title_ref, 'position': position, 'etag': etag}
-        return self._request_queue("post", '/users/%s/queues/instant' % self.id)
+        return self._request("post", '/users/%s/queues/instant' % self.id, data=data).json()
 
     def get_resource(self, url, data={}):
         return self._request("get", url, data=data)
@@ -760,25 +1602,42 @@ class User:
         data = {'start_index' : start_index, 'max_results': max_results, 'updated_min': updated_min}
         return self._request('get', url_path, data=data).json()
 
+    def iter_rental_history(self, type=None, updated_min=None, prefetch=False, deadline=None):
+        """ Same as :py:meth:`get_rental_history`, but yields the titles of all the pages of the history,
+        fetching the pages lazily
+
+        :param type: type of rental history, "watched", "shipped" etc, see :py:data:`RENTAL_HISTORY_TYPE`
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        fetch = lambda start_index, max_results: self.get_rental_history(type, start_index=start_index,
+                                                                         max_results=max_results, updated_min=updated_min)
+        return _iter_pages(fetch, ('rental_history', 'rental_history_item'), prefetch, expires=_expires(deadline))
 
-    def get_rating(self, title_refs):
+
+    def get_rating(self, title_refs, max_workers=4):
         """Returns a list of movie or television series ratings for the designated subscriber. 
         If available, the subscriber's actual ratings are returned; otherwise, the resource 
         returns the Netflix-predicted ratings.
         url: /users/userID/ratings/title 
 
         :param title_refs: List of title ids
+        :param max_workers: (Optional) Lists longer than :py:data:`MAX_TITLE_REFS` are requested in batches,
+            this many at a time
         :returns: List of rating of given titles 
         """
-        return self._request_ratings('get', '/users/%s/ratings/title' % self.id, title_refs)
+        return self._request_ratings('get', '/users/%s/ratings/title' % self.id, title_refs, max_workers=max_workers)
 
-    def get_actual_rating(self, title_refs):
+    def get_actual_rating(self, title_refs, max_workers=4):
         """Get rating for titles given by the subscriber
         url: /users/userID/ratings/title/actual
 
         :param title_refs: List of title ids
+        :param max_workers: (Optional) Lists longer than :py:data:`MAX_TITLE_REFS` are requested in batches,
+            this many at a time
         """
-        return self._request_ratings('get', '/users/%s/ratings/title/actual' % self.id, title_refs)
+        return self._request_ratings('get', '/users/%s/ratings/title/actual' % self.id, title_refs,
+                                     max_workers=max_workers)
 
     def add_my_rating(self, title_ref, rating):
         """Add user's custom rating
@@ -808,18 +1667,36 @@ class User:
         data = {'rating': rating}
         return self._request_ratings('put', '/users/%s/ratings/title/actual/%s' % (self.id, rating_id), data=data)
 
-    def get_predicted_ratings(self, title_refs):
+    def get_predicted_ratings(self, title_refs, max_workers=4):
         """ Get predicted rating for given titles
         url: /users/userID/ratings/title/predicted
 
         :param title_refs: List of title ids
+        :param max_workers: (Optional) Lists longer than :py:data:`MAX_TITLE_REFS` are requested in batches,
+            this many at a time
         """
-        return self._request_ratings('get', '/users/%s/ratings/title/predicted' % self.id, title_refs)
-
-    def _request_ratings(self, method, url_path, title_refs=[], data = {}):
-        if not data:
-            data['title_refs'] =  ','.join(title_refs)
-        return self._request(method, url_path, data=data).json()
+        return self._request_ratings('get', '/users/%s/ratings/title/predicted' % self.id, title_refs,
+                                     max_workers=max_workers)
+
+    def _request_ratings(self, method, url_path, title_refs=None, data=None, max_workers=4):
+        if data:
+            return self._request(method, url_path, data=data).json()
+
+        # Long lists of titles are split into batches of MAX_TITLE_REFS requested concurrently
+        title_refs = list(title_refs or [])
+        batches = [title_refs[i:i + MAX_TITLE_REFS] for i in range(0, len(title_refs), MAX_TITLE_REFS)] or [[]]
+        fetch = lambda refs: self._request(method, url_path, data={'title_refs': ','.join(refs)}).json()
+        results = _map_concurrently(fetch, batches, max_workers, _current_deadline())
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        if len(results) > 1:
+            # A batch of a single rating has the item itself instead of a list of items
+            for result in results:
+                ratings = result.get('ratings')
+                if isinstance(ratings, dict):
+                    ratings['ratings_item'] = _page_items(ratings, ('ratings_item',))[0]
+        return _merge_results(results)
 
     def get_recommendations(self, start_index=None, max_results=None):
         """Get Netflix's catalog title recommendations for a subscriber, based on a subscriber's viewing history.
@@ -831,7 +1708,22 @@ class User:
         data = {'start_index': start_index, 'max_results': max_results}
         return self._request('get', '/users/%s/recommendations' % self.id, data=data).json()
 
+    def iter_recommendations(self, prefetch=False, deadline=None):
+        """ Same as :py:meth:`get_recommendations`, but yields the titles of all the pages of recommendations,
+        fetching the pages lazily
+
+        :param prefetch: (Optional) If set the next page is fetched in background while the current one is consumed
+        :param deadline: (Optional) The number of seconds all the pages have to be fetched in
+        """
+        fetch = lambda start_index, max_results: self.get_recommendations(start_index=start_index,
+                                                                          max_results=max_results)
+        return _iter_pages(fetch, ('recommendations', 'recommendation'), prefetch, expires=_expires(deadline))
+
+
+    def deadline(self, seconds):
+        """ Same as :py:meth:`NetflixAPIV2.deadline`"""
+        return self._netflix_client.deadline(seconds)
 
     def _request(self, method, url, data={}, headers={}):
-        return self._netflix_client._request(method, url, data, headers, client=self._client)
+        return self._netflix_client._request(method, url, data, headers, auth=self._auth)
 
@@ -0,0 +1,119 @@
+""" Client side rate limiting, keeping the requests of a client within the netflix quotas
+"""
+
+import time
+import threading
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class TokenBucket(object):
+    """ Holds upto ``capacity`` tokens, refilled continuously at ``rate`` tokens per second"""
+
+    def __init__(self, rate, capacity):
+        """
+        :param rate: The number of tokens added per second
+        :param capacity: The maximum number of tokens held, i.e. the largest burst allowed
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.time()
+
+    def _refill(self, now):
+        # max() guards against the clock going backwards
+        elapsed = max(now - self._updated, 0)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def remaining(self, now):
+        self._refill(now)
+        return self._tokens
+
+    def wait_time(self, tokens, now):
+        """ Returns the number of seconds until ``tokens`` tokens are available"""
+        self._refill(now)
+        if self._tokens >= tokens:
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    def consume(self, tokens):
+        self._tokens -= tokens
+
+
+class RateLimiter(object):
+    """ Token bucket rate limiter with a per second and a per day budget. A request goes out only once
+    there is a token for it in both buckets, so bursts are smoothed out to the per second rate instead of
+    being answered with quota errors by netflix::
+
+        limiter = RateLimiter(per_second=4, per_day=5000)
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', rate_limiter=limiter)
+
+    The client and all of its :py:class:`~pyflix2.User` objects draw from the same limiter, a limiter
+    can also be passed to several clients sharing the same quota. It is thread safe.
+    """
+
+    def __init__(self, per_second=4, per_day=5000, burst=None, max_wait=None):
+        """
+        :param per_second: (Optional) The number of requests allowed per second, ``None`` for no limit
+        :param per_day: (Optional) The number of requests allowed per day, ``None`` for no limit
+        :param burst: (Optional) The number of requests which can be made at once after a pause,
+            defaults to ``per_second``
+        :param max_wait: (Optional) Upto how many seconds :py:meth:`acquire` blocks waiting for its turn,
+            by default it waits as long as needed
+        """
+        self._buckets = {}
+        if per_second:
+            self._buckets['second'] = TokenBucket(per_second, burst or max(per_second, 1))
+        if per_day:
+            self._buckets['day'] = TokenBucket(float(per_day) / SECONDS_PER_DAY, per_day)
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """ Returns the ``dict`` of the number of requests which can be made right away, per budget
+        (``"second"`` and ``"day"``)"""
+        with self._lock:
+            now = time.time()
+            return dict((name, int(bucket.remaining(now))) for name, bucket in self._buckets.iteritems())
+
+    def wait_time(self, tokens=1):
+        """ Returns the number of seconds until ``tokens`` requests can be made, 0 if they can be made now.
+        Lets callers which can't block schedule the request themselves"""
+        with self._lock:
+            return self._wait_time(tokens, time.time())
+
+    def _wait_time(self, tokens, now):
+        return max([bucket.wait_time(tokens, now) for bucket in self._buckets.itervalues()] + [0.0])
+
+    def try_acquire(self, tokens=1):
+        """ Takes ``tokens`` tokens if they are available right now, never blocks
+
+        :returns: True if the tokens were taken
+        """
+        return self.acquire(tokens, blocking=False)
+
+    def acquire(self, tokens=1, blocking=True, timeout=None):
+        """ Takes ``tokens`` tokens, waiting for them to become available if needed
+
+        :param tokens: (Optional) The number of requests about to be made
+        :param blocking: (Optional) If unset returns at once, whether or not tokens were taken
+        :param timeout: (Optional) The maximum number of seconds to wait, defaults to ``max_wait``
+        :returns: True if the tokens were taken, False if they couldn't be taken in time
+        """
+        if any(tokens > bucket.capacity for bucket in self._buckets.itervalues()):
+            raise ValueError("Can't acquire %s tokens at once, the burst size is smaller" % tokens)
+        if timeout is None:
+            timeout = self.max_wait
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                now = time.time()
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    for bucket in self._buckets.itervalues():
+                        bucket.consume(tokens)
+                    return True
+            if not blocking or (deadline is not None and now + wait > deadline):
+                return False
+            time.sleep(wait)
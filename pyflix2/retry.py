@@ -0,0 +1,147 @@
+""" Retry policy for the transient failures of netflix requests
+"""
+
+import time
+import random
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+import requests
+
+IDEMPOTENT_METHODS = ('get', 'head', 'options', 'put', 'delete')
+""" Methods retried by default, a POST (e.g. adding to a queue) is never repeated"""
+
+RETRY_STATUSES = (500, 502, 503, 504)
+""" Response statuses retried by default"""
+
+# Netflix answers requests over the per second quota with a 403 carrying this error code
+_OVER_QPS_ERROR_CODE = 'ERR_403_DEVELOPER_OVER_QPS'
+
+# Errors raised when no response could be read at all
+_CONNECTION_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def retry_after(response):
+    """ Returns the number of seconds the ``Retry-After`` header of ``response`` asks to wait for,
+    ``None`` if it has none. Both the delay in seconds and the http date forms are understood"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(mktime_tz(date) - time.time(), 0.0)
+
+
+class RetryPolicy(object):
+    """ Retries idempotent requests failing with a connection error or a transient status, waiting
+    a capped exponential backoff with jitter between the attempts::
+
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', retry=RetryPolicy(max_retries=5))
+
+    The policy keeps a retry budget of upto ``budget`` retries: every request adds ``budget_ratio`` to it
+    and every retry takes one off, so that when netflix is down retries can't multiply the load beyond
+    that ratio. The counters of the attempts made are in :py:attr:`stats`. A policy can be shared by
+    several clients.
+    """
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=30, jitter=True,
+                 statuses=RETRY_STATUSES, methods=IDEMPOTENT_METHODS, budget_ratio=0.2, budget=10,
+                 on_retry=None):
+        """
+        :param max_retries: (Optional) The maximum number of retries of a single request
+        :param backoff_factor: (Optional) The backoff before the ``n``-th retry is
+            ``backoff_factor * 2 ** (n - 1)`` seconds
+        :param max_backoff: (Optional) The longest backoff in seconds. A response asking (with
+            ``Retry-After``) to wait longer than that is not retried
+        :param jitter: (Optional) If set the backoff is a random duration between 0 and the exponential
+            backoff, so that clients failing together don't retry together
+        :param statuses: (Optional) The response statuses which are retried
+        :param methods: (Optional) The (lower case) http methods which are retried
+        :param budget_ratio: (Optional) The number of retries earned per request made
+        :param budget: (Optional) The maximum number of retries which can be made in a row
+        :param on_retry: (Optional) Callable invoked before every retry with the keyword arguments
+            ``method``, ``url``, ``attempt``, ``delay``, ``status`` and ``error``
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(method.lower() for method in methods)
+        self.budget_ratio = budget_ratio
+        self.budget = budget
+        self.on_retry = on_retry
+        self._budget = float(budget)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.exhausted = 0
+        self.budget_exhausted = 0
+
+    @property
+    def stats(self):
+        """ ``dict`` of the number of requests made, retries, requests failing after all their retries
+        and retries denied for lack of budget"""
+        return {'requests': self.requests, 'retries': self.retries, 'exhausted': self.exhausted,
+                'budget_exhausted': self.budget_exhausted}
+
+    def start(self):
+        """ Records a new request, adding to the retry budget"""
+        with self._lock:
+            self.requests += 1
+            self._budget = min(self._budget + self.budget_ratio, self.budget)
+
+    def is_retryable(self, method, response=None, error=None):
+        """ Returns True if the failure (either ``response`` or ``error``) of a ``method`` request is transient"""
+        if method.lower() not in self.methods:
+            return False
+        if error is not None:
+            return isinstance(error, _CONNECTION_ERRORS)
+        if response.status_code in self.statuses:
+            return True
+        return (response.status_code == 403 and
+                response.headers.get('X-Mashery-Error-Code') == _OVER_QPS_ERROR_CODE)
+
+    def backoff(self, attempt):
+        """ Returns the number of seconds to wait before retry number ``attempt`` (starting at 1)"""
+        backoff = min(self.max_backoff, self.backoff_factor * 2 ** (attempt - 1))
+        if self.jitter:
+            backoff = random.uniform(0, backoff)
+        return backoff
+
+    def next_delay(self, method, url, attempt, response=None, error=None):
+        """ Decides whether a failed attempt is retried
+
+        :param method: The http method of the request
+        :param url: The url of the request
+        :param attempt: The number of the retry about to be made, starting at 1
+        :param response: (Optional) The failed response
+        :param error: (Optional) The exception raised instead of a response
+        :returns: The number of seconds to wait before retrying, ``None`` if the request must not be retried
+        """
+        if not self.is_retryable(method, response, error):
+            return None
+        delay = self.backoff(attempt)
+        if response is not None:
+            wait = retry_after(response)
+            if wait is not None:
+                if wait > self.max_backoff:
+                    return None
+                delay = max(delay, wait)
+        with self._lock:
+            if attempt > self.max_retries:
+                self.exhausted += 1
+                return None
+            if self._budget < 1:
+                self.budget_exhausted += 1
+                return None
+            self._budget -= 1
+            self.retries += 1
+        if self.on_retry is not None:
+            self.on_retry(method=method, url=url, attempt=attempt, delay=delay,
+                          status=response.status_code if response is not None else None, error=error)
+        return delay
@@ -0,0 +1,91 @@
+""" Cached OAuth1 signers, so that creating clients and users doesn't redo the signing setup
+"""
+
+import hmac
+import binascii
+import threading
+from hashlib import sha1
+from collections import OrderedDict
+from urlparse import parse_qsl
+
+from oauthlib.common import urlencode
+from oauthlib.oauth1 import Client, SIGNATURE_HMAC, SIGNATURE_TYPE_QUERY
+from oauthlib.oauth1.rfc5849 import signature
+from oauthlib.oauth1.rfc5849.utils import escape
+from requests_oauthlib import OAuth1
+
+MAX_SIGNERS = 1024
+""" The number of signers kept by :py:func:`get_signer`, the least recently used ones are dropped"""
+
+_signers = OrderedDict()
+_signers_lock = threading.Lock()
+
+
+def _sign_hmac_sha1(base_string, client):
+    # Only the base string is hashed per request, the HMAC state of the key is computed once per client
+    digest = client.hmac_sha1.copy()
+    digest.update(base_string.encode('utf-8'))
+    return binascii.b2a_base64(digest.digest())[:-1].decode('utf-8')
+
+
+# The fast path needs the signature helpers of oauthlib >= 1.0, older versions sign as usual
+_FAST_PATH = (hasattr(Client, 'SIGNATURE_METHODS') and hasattr(signature, 'base_string_uri') and
+              hasattr(signature, 'signature_base_string'))
+
+
+class CachedKeyClient(Client):
+    """ OAuth1 client which derives the HMAC-SHA1 key from the secrets once instead of on every request,
+    and builds the signature base string of requests without a body straight from the url. The oauth
+    parameters of such requests are appended to the url, rather than re-encoding its whole query"""
+
+    if _FAST_PATH:
+        SIGNATURE_METHODS = dict(Client.SIGNATURE_METHODS)
+        SIGNATURE_METHODS[SIGNATURE_HMAC] = _sign_hmac_sha1
+
+    def __init__(self, *args, **kwargs):
+        super(CachedKeyClient, self).__init__(*args, **kwargs)
+        key = escape(self.client_secret or u'') + u'&' + escape(self.resource_owner_secret or u'')
+        self.hmac_sha1 = hmac.new(key.encode('utf-8'), digestmod=sha1)
+
+    def get_oauth_signature(self, request):
+        if not _FAST_PATH or self.signature_method != SIGNATURE_HMAC or request.body:
+            return super(CachedKeyClient, self).get_oauth_signature(request)
+        # Same parameters as collected by oauthlib, but without rendering the oauth
+        # parameters into the url only to parse them back out
+        query = request.uri.partition('?')[2].partition('#')[0]
+        params = [(k.decode('utf-8'), v.decode('utf-8'))
+                  for k, v in parse_qsl(query.encode('utf-8'), keep_blank_values=True)]
+        params.extend((k, v) for k, v in request.oauth_params if k not in ('oauth_signature', 'realm'))
+        base_string = signature.signature_base_string(
+            request.http_method, signature.base_string_uri(request.uri, request.headers.get('Host')),
+            signature.normalize_parameters(params))
+        return _sign_hmac_sha1(base_string, self)
+
+    def _render(self, request, formencode=False, realm=None):
+        if not _FAST_PATH or self.signature_type != SIGNATURE_TYPE_QUERY or request.body:
+            return super(CachedKeyClient, self)._render(request, formencode, realm)
+        separator = u'&' if u'?' in request.uri else u'?'
+        return request.uri + separator + urlencode(request.oauth_params), request.headers, request.body
+
+
+def get_signer(consumer_key, consumer_secret, token=None, token_secret=None, signature_type='AUTH_HEADER'):
+    """ Returns the ``requests`` auth object signing requests with the given credentials. Signers are
+    cached by ``(consumer, token)``, so the same object is returned for the same credentials.
+
+    :param consumer_key: The consumer key of the application
+    :param consumer_secret: The consumer secret of the application
+    :param token: (Optional) The access token of the user
+    :param token_secret: (Optional) The access token secret of the user
+    :param signature_type: (Optional) Where the signature goes, ``"AUTH_HEADER"`` or ``"QUERY"``
+    """
+    key = (consumer_key, consumer_secret, token, token_secret, signature_type.upper())
+    with _signers_lock:
+        signer = _signers.pop(key, None)
+        if signer is None:
+            signer = OAuth1(consumer_key, client_secret=consumer_secret, resource_owner_key=token,
+                            resource_owner_secret=token_secret, signature_type=signature_type,
+                            client_class=CachedKeyClient)
+        _signers[key] = signer
+        while len(_signers) > MAX_SIGNERS:
+            _signers.popitem(last=False)
+    return signer
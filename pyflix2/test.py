@@ -1,10 +1,33 @@
 # Sample code to use the Netflix python client
 import unittest, os
-import simplejson
+import requests
+import json
+import gzip
+import time
+import shutil
+import tempfile
+from cStringIO import StringIO
 from pprint import pprint
 from pyflix2 import *
+from fakeserver import FakeNetflixServer
+from retry import RetryPolicy, retry_after
+from ratelimit import TokenBucket, RateLimiter, SECONDS_PER_DAY
+from circuit import CircuitBreaker
+from catalog import iter_titles, CatalogSnapshot, ADDED, MODIFIED, REMOVED
+from index import TitleIndex, AutocompleteIndex
+from cache import DiskCache, MemoryCache, cache_ttl
+from transport import RecordingTransport, ReplayTransport
+from asyncclient import AsyncNetflixAPIV2
+from metrics import Metrics, RequestHook, endpoint_template
+from logs import BackgroundWriter, QueueHandler
+from signing import CachedKeyClient
+from requests_oauthlib import OAuth1
 import ConfigParser
 import codecs
+import threading
+import logging
+from multiprocessing.pool import ThreadPool
+from email.utils import formatdate
 
 DUMP_OBJECTS = True
 
@@ -136,6 +159,11 @@ class TestNetflixAPIV2(unittest.TestCase):
         self.assertIsNotNone(m)
         #dump_object(m)
 
+        ids = [title['id'] for title in titles_instant['catalog'][:5]]
+        titles = self.netflix.get_titles(ids + ['bad id'])
+        self.assertEqual(len(titles), 6)
+        self.assertIsInstance(titles[-1], NetflixError)
+
         titles_disc = self.netflix.search_titles('Matrix', filter="disc")
         self.assertNotEqual(titles_instant['number_of_results'], titles_disc['number_of_results'])
 
@@ -159,6 +187,19 @@ class TestNetflixAPIV2(unittest.TestCase):
         catalog = self.netflix.get_catalog()
         self.assertIsNotNone(catalog)
 
+    def test_full_catalog_parsed(self):
+        for title in self.netflix.get_catalog(parse=True):
+            self.assertIsNotNone(title['id'])
+            break
+
+    def test_download_catalog(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = self.netflix.download_catalog(os.path.join(directory, 'catalog.gz'), 'streaming')
+            self.assertTrue(os.path.getsize(path) > 0)
+        finally:
+            shutil.rmtree(directory)
+
     def test_user_details(self):
         self.assertIsNotNone(self.user)
         #dump_object(dir(self.user))
@@ -276,6 +317,855 @@ class TestNetflixAPIV2(unittest.TestCase):
             self.assertIsNotNone(movie['title']['regular'])
 
 
+class TestSigning(unittest.TestCase):
+    """ The cached signer must sign exactly like the plain ``OAuth1`` one"""
+
+    def sign(self, client_class, signature_type, method, url, params=None, data=None):
+        auth = OAuth1('consumer_key', client_secret='consumer_secret', resource_owner_key='access_token',
+                      resource_owner_secret='access_token_secret', signature_type=signature_type,
+                      client_class=client_class, nonce=u'a1b2c3d4e5', timestamp=u'1300000000')
+        request = auth(requests.Request(method, url, params=params, data=data).prepare())
+        return request.url, request.headers.get('Authorization'), request.body
+
+    def test_same_signatures(self):
+        urls = [('http://api-public.netflix.com/catalog/titles', {'term': 'matrix', 'v': '2.0'}),
+                ('http://api-public.netflix.com/catalog/titles?output=json', {'term': u'am\xe9lie caf\xe9'}),
+                ('http://api-public.netflix.com/users/T1abc/ratings/title',
+                 [('title_refs', 'http://api-public.netflix.com/catalog/titles/movies/1'), ('title_refs', '2'),
+                  ('empty', '')]),
+                ('http://api-public.netflix.com/catalog/titles/full?v=2.0&v=2.0', None)]
+        for signature_type in ('AUTH_HEADER', 'QUERY'):
+            for method in ('GET', 'POST', 'DELETE'):
+                for url, params in urls:
+                    cases = [(params, None)]
+                    if method == 'POST':
+                        cases.append((None, params))
+                    for params, data in cases:
+                        self.assertEqual(self.sign(CachedKeyClient, signature_type, method, url, params, data),
+                                         self.sign(None, signature_type, method, url, params, data),
+                                         (signature_type, method, url, params, data))
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def gzipped(data):
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class TestCatalog(unittest.TestCase):
+    titles = [{'id': u'http://api.netflix.com/catalog/titles/movies/%d' % n, 'title': u'Am\xe9lie %d' % n,
+               'release_year': 2000 + n} for n in range(50)]
+
+    def assertParsed(self, data, titles=None):
+        for size in (1, 7, 4096):
+            self.assertEqual(list(iter_titles(chunked(data, size))), titles or self.titles)
+
+    def test_json_formats(self):
+        array = json.dumps(self.titles, indent=1)
+        wrapper = json.dumps({'catalog': self.titles, 'number_of_results': len(self.titles)})
+        # Metadata ahead of the title array, on one line and pretty printed
+        metadata = '{"number_of_results": %d, "start_index": 0, "filter": {"type": "instant"}, "catalog": %s}' % (
+            len(self.titles), json.dumps(self.titles))
+        lines = ''.join(json.dumps(title) + '\n' for title in self.titles)
+        for data in (array, wrapper, metadata, metadata.replace(', "', ',\n  "'), lines,
+                     json.dumps(self.titles, ensure_ascii=False).encode('utf-8')):
+            self.assertParsed(data)
+            self.assertParsed(gzipped(data))
+        # Catalogs made of several gzip members
+        self.assertParsed(gzipped(lines[:1000]) + gzipped(lines[1000:]))
+        self.assertEqual(list(iter_titles([])), [])
+
+    def test_xml_format(self):
+        data = u'<catalog_titles>%s</catalog_titles>' % u''.join(
+            u'<catalog_title><id>%s</id><title short="%s" regular="%s"/><release_year>%d</release_year>'
+            u'</catalog_title>' % (t['id'], t['title'], t['title'], t['release_year']) for t in self.titles)
+        titles = [{'id': t['id'], 'title': {'short': t['title'], 'regular': t['title']},
+                   'release_year': str(t['release_year'])} for t in self.titles]
+        self.assertParsed(data.encode('utf-8'), titles)
+        self.assertParsed(gzipped(data.encode('utf-8')), titles)
+
+    def test_snapshot_diff(self):
+        delta, snapshot = CatalogSnapshot().diff(self.titles)
+        self.assertEqual(delta.added, self.titles)
+        self.assertEqual((delta.modified, delta.removed, len(snapshot)), ([], [], len(self.titles)))
+
+        titles = [dict(title) for title in self.titles[5:]] + [{'id': u'new', 'title': u'New'}]
+        titles[0]['release_year'] = 1999
+        delta, current = snapshot.diff(titles)
+        self.assertEqual(delta.added, [{'id': u'new', 'title': u'New'}])
+        self.assertEqual(delta.modified, [titles[0]])
+        self.assertEqual(sorted(delta.removed), sorted(title['id'] for title in self.titles[:5]))
+        self.assertEqual(len(current), len(titles))
+
+        changes = list(snapshot.iter_changes(titles))
+        self.assertEqual([change for change, _ in changes], [MODIFIED, ADDED] + [REMOVED] * 5)
+        self.assertEqual(snapshot.diff(self.titles)[0], ([], [], []))
+
+    def test_snapshot_save_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'catalog.snapshot')
+            self.assertEqual(len(CatalogSnapshot.load(path)), 0)
+            snapshot = CatalogSnapshot()
+            snapshot.update(self.titles + [{'id': u'caf\xe9\tid'}])
+            snapshot.save(path)
+            self.assertEqual(CatalogSnapshot.load(path).fingerprints, snapshot.fingerprints)
+            self.assertEqual(os.listdir(directory), ['catalog.snapshot'])
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestAutocompleteIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = AutocompleteIndex()
+        self.index.import_catalog([{'title': {'short': u'The Matrix', 'regular': u'The Matrix'}},
+                                   {'title': u'Matrix  Reloaded'}, {'title': u'The Lost Garden'}], filter='instant')
+        self.index.import_catalog([{'title': u'The Matrix'}, {'title': u'Marooned'}], filter='disc')
+        self.index.add(u'Mat The Mat')
+
+    def test_prefix(self):
+        self.assertEqual(len(self.index), 5)
+        # Matches on any word, ordered by the text following the match
+        self.assertEqual(self.index.search(u'mat'), [u'Mat The Mat', u'The Matrix', u'Matrix  Reloaded'])
+        self.assertEqual(self.index.search(u'  MATRIX  r'), [u'Matrix  Reloaded'])
+        self.assertEqual(self.index.search(u'garden'), [u'The Lost Garden'])
+        self.assertEqual(self.index.search(u'the'), [u'The Lost Garden', u'Mat The Mat', u'The Matrix'])
+        self.assertEqual(self.index.search(u'atrix'), [])
+        self.assertEqual(self.index.search(u' '), [])
+
+    def test_filter(self):
+        self.assertEqual(self.index.search(u'ma', filter='disc'), [u'Marooned', u'The Matrix'])
+        self.assertEqual(self.index.search(u'ma', filter='instant'), [u'The Matrix', u'Matrix  Reloaded'])
+        self.assertEqual(self.index.title_autocomplete(u'gard', filter='disc'), {'autocomplete': {}})
+
+    def test_paging(self):
+        self.assertEqual(self.index.search(u'm', start_index=1, max_results=2), [u'Mat The Mat', u'The Matrix'])
+        self.assertEqual(self.index.search(u'm', start_index=3), [u'Matrix  Reloaded'])
+        for n in range(40):
+            self.index.add(u'Title %d' % n)
+        self.assertEqual(len(self.index.search(u'tit')), 25)
+        self.assertEqual(len(self.index.search(u'tit', max_results=100)), 40)
+        self.assertEqual(self.index.title_autocomplete(u'title 1', max_results=2),
+                         {'autocomplete': {'title': [u'Title 1', u'Title 10']}})
+
+
+class TestMemoryCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = MemoryCache(max_entries=2)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', {'content': 'a'}, 60)
+        cache.set('b', {'content': 'b'}, 60)
+        self.assertEqual(cache.get('a')['content'], 'a')
+        cache.set('c', {'content': 'c'}, 60)
+        # b was the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c')['content'], 'c')
+        cache.set('d', {'content': 'd'}, 60)
+        self.assertEqual(cache.stats, {'hits': 2, 'stale_hits': 0, 'misses': 2, 'evictions': 2})
+        self.assertEqual(len(cache), 2)
+
+    def test_expiry(self):
+        cache = MemoryCache()
+        cache.set('a', {'content': 'a'}, -1)
+        self.assertIsNotNone(cache.get('a', max_stale=60))
+        self.assertEqual(cache.stale_hits, 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_cache_ttl(self):
+        self.assertEqual(cache_ttl(response(200), 3600), 3600)
+        self.assertEqual(cache_ttl(response(200, **{'Cache-Control': 'public, max-age=30'}), 3600), 30)
+        for directive in ('no-store', 'no-cache', 'private, max-age=30'):
+            self.assertEqual(cache_ttl(response(200, **{'Cache-Control': directive}), 3600), 0)
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def entry(self, content):
+        return {'status': 200, 'url': 'http://api.netflix.com/', 'headers': {}, 'encoding': 'utf-8',
+                'content': content}
+
+    def test_journal_replay(self):
+        cache = DiskCache(self.directory, fsync=False)
+        cache.set('a', self.entry('{"a": 1}'), 60)
+        cache.set('b', self.entry('\x00\xff'), 60)
+        cache.set('c', self.entry('c'), 0)
+        cache.set('a', self.entry('{"a": 2}'), 60)
+        # The expired entry is deleted as it is read
+        self.assertIsNone(cache.get('c'))
+        # Not closed, the reopened cache replays the journal
+        cache = DiskCache(self.directory, fsync=False)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a')['content'], '{"a": 2}')
+        self.assertEqual(cache.get('b')['content'], '\x00\xff')
+        self.assertIsNone(cache.get('c'))
+        cache.close()
+        self.assertEqual(len(DiskCache(self.directory)), 2)
+
+    def test_torn_journal(self):
+        cache = DiskCache(self.directory, fsync=False)
+        cache.set('a', self.entry('a'), 60)
+        cache.set('b', self.entry('b'), 60)
+        index_path = os.path.join(self.directory, DiskCache.INDEX)
+        with open(index_path, 'rb') as f:
+            journal = f.read()
+        # A crash tore the last line, and left a blob without its journal entry and half written files
+        with open(index_path, 'wb') as f:
+            f.write(journal[:-10])
+        for name in (cache._name('c'), cache._name('d') + '.tmp', DiskCache.INDEX + '.tmp'):
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write('partial')
+        with open(os.path.join(self.directory, 'notes.txt'), 'wb') as f:
+            f.write('not the cache')
+        cache = DiskCache(self.directory, fsync=False)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get('a')['content'], 'a')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted([DiskCache.INDEX, cache._name('a'), 'notes.txt']))
+
+    def test_size_eviction(self):
+        content = os.urandom(1000)
+        cache = DiskCache(self.directory, fsync=False)
+        cache.set('a', self.entry(content), 60)
+        # The responses take the same room on disk, room is made for 3 of them
+        max_size = cache.size * 7 // 2
+        cache = DiskCache(self.directory, max_size=max_size, fsync=False)
+        for key in 'bc':
+            cache.set(key, self.entry(content), 60)
+        cache.get('a')
+        cache.set('d', self.entry(content), 60)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertTrue(cache.size <= max_size)
+        self.assertEqual(len(DiskCache(self.directory, max_size=max_size * 2 // 3, fsync=False)), 2)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=2, capacity=4)
+        now = time.time()
+        self.assertEqual(bucket.remaining(now), 4)
+        bucket.consume(4)
+        self.assertEqual(bucket.wait_time(1, now), 0.5)
+        self.assertAlmostEqual(bucket.remaining(now + 1), 2)
+        self.assertAlmostEqual(bucket.wait_time(4, now + 1), 1)
+        # Never refilled over the capacity, nor emptied by the clock going backwards
+        self.assertEqual(bucket.remaining(now + 60), 4)
+        self.assertEqual(bucket.remaining(now), 4)
+
+    def test_acquire(self):
+        limiter = RateLimiter(per_second=10, per_day=None, burst=2)
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        started = time.time()
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        self.assertTrue(time.time() - started < 0.05)
+        self.assertTrue(limiter.acquire(timeout=1))
+        self.assertTrue(0.05 < time.time() - started < 0.5)
+        self.assertRaises(ValueError, limiter.acquire, 3)
+        limiter = RateLimiter(per_second=1, per_day=None, max_wait=0.01)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+
+    def test_daily_budget(self):
+        limiter = RateLimiter(per_second=None, per_day=2)
+        self.assertEqual(limiter.remaining(), {'day': 2})
+        self.assertTrue(limiter.try_acquire(2))
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        self.assertAlmostEqual(limiter.wait_time(), SECONDS_PER_DAY / 2.0, delta=1)
+
+
+def response(status, **headers):
+    r = requests.models.Response()
+    r.status_code = status
+    r.headers.update(headers)
+    return r
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff_factor=0.5, max_backoff=3, jitter=False)
+        self.assertEqual([policy.backoff(attempt) for attempt in range(1, 5)], [0.5, 1, 2, 3])
+        policy.jitter = True
+        for attempt in range(1, 5):
+            self.assertTrue(0 <= policy.backoff(attempt) <= min(0.5 * 2 ** (attempt - 1), 3))
+
+    def test_retryable(self):
+        policy = RetryPolicy(jitter=False, budget=100)
+        self.assertEqual(policy.next_delay('get', '/', 1, response(503)), 0.5)
+        self.assertEqual(policy.next_delay('GET', '/', 2, error=requests.exceptions.ConnectionError()), 1)
+        self.assertIsNotNone(policy.next_delay('delete', '/', 1, error=requests.exceptions.Timeout()))
+        self.assertIsNotNone(policy.next_delay('get', '/', 1,
+                                               response(403, **{'X-Mashery-Error-Code': 'ERR_403_DEVELOPER_OVER_QPS'})))
+        self.assertIsNone(policy.next_delay('get', '/', 1, response(403)))
+        self.assertIsNone(policy.next_delay('get', '/', 1, response(404)))
+        self.assertIsNone(policy.next_delay('get', '/', 1, error=ValueError()))
+        # A POST isn't idempotent, it is never repeated
+        self.assertIsNone(policy.next_delay('post', '/', 1, response(503)))
+        self.assertIsNone(policy.next_delay('POST', '/', 1, error=requests.exceptions.ConnectionError()))
+        self.assertIsNone(policy.next_delay('get', '/', 4, response(503)))
+        self.assertEqual(policy.stats, {'requests': 0, 'retries': 4, 'exhausted': 1, 'budget_exhausted': 0})
+
+    def test_retry_after(self):
+        self.assertIsNone(retry_after(response(503)))
+        self.assertEqual(retry_after(response(503, **{'Retry-After': ' 2 '})), 2)
+        self.assertAlmostEqual(retry_after(response(503, **{'Retry-After': formatdate(time.time() + 20)})), 20,
+                               delta=2)
+        self.assertEqual(retry_after(response(503, **{'Retry-After': formatdate(time.time() - 20)})), 0)
+        self.assertIsNone(retry_after(response(503, **{'Retry-After': 'soon'})))
+
+        policy = RetryPolicy(max_backoff=10, jitter=False)
+        self.assertEqual(policy.next_delay('get', '/', 1, response(503, **{'Retry-After': '2'})), 2)
+        self.assertEqual(policy.next_delay('get', '/', 3, response(503, **{'Retry-After': '1'})), 2)
+        self.assertIsNone(policy.next_delay('get', '/', 1, response(503, **{'Retry-After': '60'})))
+
+    def test_budget(self):
+        retries = []
+        policy = RetryPolicy(budget=2, budget_ratio=0.5, max_retries=10,
+                             on_retry=lambda **kwargs: retries.append(kwargs))
+        self.assertIsNotNone(policy.next_delay('get', '/a', 1, response(503)))
+        self.assertIsNotNone(policy.next_delay('get', '/b', 1, response(502)))
+        self.assertIsNone(policy.next_delay('get', '/c', 1, response(503)))
+        policy.start()
+        self.assertIsNone(policy.next_delay('get', '/c', 1, response(503)))
+        policy.start()
+        self.assertIsNotNone(policy.next_delay('get', '/c', 1, response(503)))
+        self.assertEqual(policy.stats, {'requests': 2, 'retries': 3, 'exhausted': 0, 'budget_exhausted': 2})
+        self.assertEqual([(retry['url'], retry['status']) for retry in retries],
+                         [('/a', 503), ('/b', 502), ('/c', 503)])
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_transitions(self):
+        breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, reset_timeout=0.1, half_open_calls=1)
+        for failed in (False, True, False):
+            self.assertTrue(breaker.allow('catalog'))
+            breaker.record('catalog', failed, 0.01)
+        self.assertEqual(breaker.state('catalog'), 'closed')
+        breaker.record('catalog', True, 0.01)
+        self.assertEqual(breaker.state('catalog'), 'open')
+        self.assertFalse(breaker.allow('catalog'))
+        self.assertTrue(0 < breaker.retry_in('catalog') <= 0.1)
+        # The other families aren't affected
+        self.assertTrue(breaker.allow('users'))
+        breaker.record('users', False, 0.01)
+
+        time.sleep(0.15)
+        self.assertEqual(breaker.state('catalog'), 'half_open')
+        self.assertTrue(breaker.allow('catalog'))
+        self.assertFalse(breaker.allow('catalog'))
+        # A failed probe opens the circuit again
+        breaker.record('catalog', True, 0.01)
+        self.assertEqual(breaker.state('catalog'), 'open')
+
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow('catalog'))
+        # A cancelled probe lets another one through
+        breaker.cancel('catalog')
+        self.assertTrue(breaker.allow('catalog'))
+        breaker.record('catalog', False, 0.01)
+        self.assertEqual(breaker.state('catalog'), 'closed')
+        self.assertEqual(breaker.stats['catalog'], {'state': 'closed', 'calls': 0, 'failures': 0, 'slow': 0})
+
+    def test_slow_calls(self):
+        breaker = CircuitBreaker(slow_call_rate=0.5, slow_call_duration=1, min_calls=2)
+        breaker.record('users', False, 0.5)
+        breaker.record('users', False, 2)
+        self.assertEqual(breaker.state('users'), 'open')
+        breaker = CircuitBreaker(slow_call_duration=None, min_calls=2)
+        breaker.record('users', False, 60)
+        breaker.record('users', False, 60)
+        self.assertEqual(breaker.state('users'), 'closed')
+
+
+class TestLogs(unittest.TestCase):
+
+    class Formatted(object):
+        def __init__(self):
+            self.count = 0
+
+        def __str__(self):
+            self.count += 1
+            return 'formatted'
+
+    def test_background_writer(self):
+        class Stream(object):
+            def __init__(self):
+                self.lines, self.flushed = [], False
+                self.gate = threading.Event()
+
+            def write(self, text):
+                self.gate.wait()
+                self.lines.append((text, threading.current_thread().name))
+
+            def flush(self):
+                self.flushed = True
+
+        stream = Stream()
+        writer = BackgroundWriter(stream)
+        for i in range(20):
+            writer.write('line %d\n' % i)
+        # write() only queues, the blocked stream holds up the writer thread but not the caller
+        self.assertEqual(stream.lines, [])
+        stream.gate.set()
+        writer.close()
+        self.assertEqual(stream.lines, [('line %d\n' % i, 'pyflix2-log-writer') for i in range(20)])
+        self.assertTrue(stream.flushed)
+        self.assertEqual(writer.dropped, 0)
+
+    def test_queue_handler(self):
+        class Handler(logging.Handler):
+            def __init__(self):
+                logging.Handler.__init__(self)
+                self.records = []
+                self.gate = threading.Event()
+
+            def emit(self, record):
+                self.gate.wait()
+                self.records.append((self.format(record), threading.current_thread().name))
+
+        handler = Handler()
+        queue_handler = QueueHandler(handler)
+        logger = logging.getLogger('pyflix2.test.logs')
+        logger.propagate = False
+        logger.setLevel(logging.WARNING)
+        logger.addHandler(queue_handler)
+        try:
+            formatted = self.Formatted()
+            logger.debug('%s', formatted)
+            netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', logger=logger)
+            netflix._log('%s', formatted)
+            self.assertEqual(formatted.count, 0)
+
+            for i in range(5):
+                logger.warning('%s %d', formatted, i)
+            netflix._log('%s %d', formatted, 5, level=logging.WARNING)
+            # The records are formatted by the background thread
+            self.assertEqual(formatted.count, 0)
+            handler.gate.set()
+            queue_handler.close()
+            self.assertEqual(handler.records, [('formatted %d' % i, 'pyflix2-log-writer') for i in range(6)])
+            self.assertEqual(formatted.count, 6)
+        finally:
+            logger.removeHandler(queue_handler)
+
+
+class TestFakeNetflixServer(unittest.TestCase):
+    """ Runs against the local stand-in server, no credentials or network access needed"""
+
+    def setUp(self):
+        self.server = FakeNetflixServer(titles=300, strict_auth=True).start()
+        self.netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url)
+        request_token, request_token_secret, url = self.netflix.get_request_token(use_OOB=True)
+        verifier = self.server.authorize(request_token)
+        user_id, access_token, access_token_secret = self.netflix.get_access_token(request_token,
+                                                                                   request_token_secret, verifier)
+        self.user = self.netflix.get_user(user_id, access_token, access_token_secret)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_catalog_functions(self):
+        titles = self.netflix.search_titles('matrix', max_results=5)
+        self.assertEqual(len(titles['catalog']), 5)
+        self.assertEqual(len(list(self.netflix.iter_search_titles('matrix'))), titles['number_of_results'])
+        for name in self.netflix.title_autocomplete('mat')['autocomplete']['title']:
+            self.assertIn('matrix', name.lower())
+        title = self.netflix.get_title(titles['catalog'][0]['id'])
+        self.assertEqual(title['catalog_title']['id'], titles['catalog'][0]['id'])
+        name = self.netflix.get_title(self.server.title_id(1))['catalog_title']['title']
+        self.assertEqual(self.netflix.get_movie_by_title(name.upper())['id'], self.server.title_id(1))
+        self.assertIsNone(self.netflix.get_movie_by_title(name + ' 2'))
+
+        netflix = NetflixAPIV1('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url)
+        self.assertEqual(netflix.get_movie_by_title(name)['title']['regular'], name)
+        for item in netflix.title_autocomplete('mat')['autocomplete']['autocomplete_item']:
+            self.assertIn('matrix', item['title']['short'].lower())
+        self.assertIsNotNone(self.netflix.get_title(titles['catalog'][0]['id'], 'cast')['cast'])
+        self.assertRaises(NetflixError, self.netflix.get_title, self.server.title_id(1000))
+
+    def test_title_index(self):
+        index = TitleIndex()
+        index.import_catalog(self.netflix.get_catalog(parse=True))
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               title_index=index)
+        title_id = self.server.title_id(7)
+        requests_made = self.server.request_count
+        title = netflix.get_title(title_id)
+        self.assertEqual(netflix.get_movie_by_title(title['catalog_title']['title'])['id'], title_id)
+        self.assertEqual(self.server.request_count, requests_made)
+        self.assertEqual(title, self.netflix.get_title(title_id))
+
+    def get_titles_concurrently(self, netflix, title_id, count):
+        """ Calls ``get_title`` from ``count`` threads at once, returns the responses and errors"""
+        def get_title(_):
+            try:
+                return netflix.get_title(title_id)
+            except Exception as e:
+                return e
+        pool = ThreadPool(count)
+        try:
+            return pool.map(get_title, range(count))
+        finally:
+            pool.close()
+
+    def test_coalescing(self):
+        title_id = self.server.title_id(3)
+        self.server.inject_fault(None, delay=0.3)
+        requests_made = self.server.request_count
+        titles = self.get_titles_concurrently(self.netflix, title_id, 8)
+        self.assertEqual(self.server.request_count, requests_made + 1)
+        self.assertEqual(titles, [self.netflix.get_title(title_id)] * 8)
+
+        self.server.inject_fault(404, delay=0.3)
+        requests_made = self.server.request_count
+        errors = self.get_titles_concurrently(self.netflix, title_id, 8)
+        self.assertEqual(self.server.request_count, requests_made + 1)
+        for error in errors:
+            self.assertIsInstance(error, NetflixError)
+            self.assertEqual(str(error), str(errors[0]))
+
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               coalesce=False)
+        requests_made = self.server.request_count
+        self.get_titles_concurrently(netflix, title_id, 4)
+        self.assertEqual(self.server.request_count, requests_made + 4)
+
+    def test_coalesced_deadline(self):
+        title_id = self.server.title_id(3)
+        self.server.inject_fault(None, delay=0.5)
+        leader = threading.Thread(target=self.netflix.get_title, args=(title_id,))
+        leader.start()
+        time.sleep(0.1)
+        # The follower waits on the response of the leader, but not past its own deadline
+        started = time.time()
+        with self.netflix.deadline(0.1):
+            self.assertRaises(DeadlineExceededError, self.netflix.get_title, title_id)
+        self.assertTrue(time.time() - started < 0.3)
+        leader.join()
+
+    def test_stale_while_revalidate(self):
+        cache = MemoryCache()
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               cache=cache, cache_ttl=0.1, stale_while_revalidate=60)
+        title_id = self.server.title_id(3)
+        title = netflix.get_title(title_id)
+        time.sleep(0.15)
+        # The refresh is slow, the stale response keeps being served meanwhile
+        self.server.inject_fault(None, delay=0.3)
+        requests_made = self.server.request_count
+        for _ in range(5):
+            self.assertEqual(netflix.get_title(title_id), title)
+        self.assertEqual(cache.stale_hits, 5)
+        time.sleep(0.5)
+        self.assertEqual(self.server.request_count, requests_made + 1)
+
+    def test_cache(self):
+        cache = MemoryCache()
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               cache=cache)
+        title_id = self.server.title_id(3)
+        requests_made = self.server.request_count
+        title = netflix.get_title(title_id)
+        self.assertEqual(netflix.get_title(title_id), title)
+        self.assertEqual(self.server.request_count, requests_made + 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # Responses the server asks not to store aren't cached
+        self.server.inject_fault(None, headers={'Cache-Control': 'no-store'})
+        netflix.get_title(self.server.title_id(4))
+        netflix.get_title(self.server.title_id(4))
+        self.server.inject_fault(None, headers={'Cache-Control': 'max-age=0'})
+        netflix.get_title(self.server.title_id(5))
+        netflix.get_title(self.server.title_id(5))
+        self.assertEqual(self.server.request_count, requests_made + 5)
+        # The second responses had no Cache-Control
+        self.assertEqual(len(cache), 3)
+
+        # Nor are the requests of the users
+        user = netflix.get_user(self.user.id, self.user._access_token, self.user._access_token_secret)
+        requests_made = self.server.request_count
+        self.assertEqual(user.get_details(), user.get_details())
+        self.assertEqual(self.server.request_count, requests_made + 2)
+        self.assertEqual(len(cache), 3)
+
+    def test_connection_pool(self):
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               pool_connections=3, pool_maxsize=7, pool_block=True)
+        adapter = netflix._client.get_adapter(self.server.base_url)
+        self.assertIsInstance(adapter, requests.adapters.HTTPAdapter)
+        self.assertIs(adapter, netflix._client.get_adapter('https://api-public.netflix.com'))
+        self.assertEqual((adapter._pool_connections, adapter._pool_maxsize, adapter._pool_block), (3, 7, True))
+
+        # The users send their requests through the session of the client, over its kept alive connection
+        user = netflix.get_user(self.user.id, self.user._access_token, self.user._access_token_secret)
+        other = netflix.get_user(self.user.id, self.user._access_token, self.user._access_token_secret)
+        connections = self.server.connection_count
+        netflix.get_title(self.server.title_id(1))
+        user.get_details()
+        other.get_details()
+        self.assertEqual(len(adapter.poolmanager.pools), 1)
+        self.assertEqual(adapter.get_connection(self.server.base_url).num_connections, 1)
+        self.assertEqual(self.server.connection_count, connections + 1)
+        self.assertEqual(netflix._client.headers['Connection'], 'keep-alive')
+
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               keep_alive=False)
+        user = netflix.get_user(self.user.id, self.user._access_token, self.user._access_token_secret)
+        connections = self.server.connection_count
+        netflix.get_title(self.server.title_id(1))
+        user.get_details()
+        self.assertEqual(netflix._client.headers['Connection'], 'close')
+        self.assertEqual(self.server.connection_count, connections + 2)
+
+    def test_metrics(self):
+        class Recorder(RequestHook):
+            def __init__(self):
+                self.before, self.after = [], []
+
+            def before_request(self, event):
+                self.before.append(dict(event))
+
+            def after_request(self, event):
+                self.after.append(dict(event))
+
+        metrics, recorder = Metrics(), Recorder()
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               cache=MemoryCache(), retry=RetryPolicy(backoff_factor=0.01), hooks=[metrics, recorder])
+        self.server.inject_fault(503, delay=0.05)
+        netflix.get_title(self.server.title_id(1))
+        netflix.get_title(self.server.title_id(1))
+        netflix.get_title(self.server.title_id(2))
+        self.assertRaises(NetflixError, netflix.get_title, self.server.title_id(1000))
+        user = netflix.get_user(self.user.id, self.user._access_token, self.user._access_token_secret)
+        user.get_details()
+
+        self.assertEqual([event['status'] for event in recorder.before], [None] * 5)
+        self.assertEqual([(event['status'], event['retries'], event['cache']) for event in recorder.after],
+                         [(200, 1, 'miss'), (200, 0, 'hit'), (200, 0, 'miss'), (404, 0, 'miss'), (200, 0, None)])
+        self.assertTrue(recorder.after[0]['elapsed'] >= 0.05)
+        self.assertIsInstance(recorder.after[3]['error'], NetflixError)
+        self.assertTrue(recorder.after[2]['response_bytes'] > 0)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(sorted(snapshot), ['GET /catalog/titles/movies/{id}', 'GET /users/{user_id}'])
+        stats = snapshot['GET /catalog/titles/movies/{id}']
+        self.assertEqual((stats['count'], stats['errors'], stats['statuses'], stats['retries'], stats['cache']),
+                         (4, 1, {200: 3, 404: 1}, 1, {'miss': 3, 'hit': 1}))
+        self.assertTrue(stats['latency']['max'] >= 0.05)
+        self.assertEqual(sum(count for _, count in stats['latency']['buckets']), 4)
+        self.assertEqual(snapshot['GET /users/{user_id}']['cache'], {})
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
+        self.assertEqual(endpoint_template('http://api.netflix.com/users/T1abc/queues/instant/available/70000001'),
+                         '/users/{user_id}/queues/instant/available/{id}')
+
+    def test_custom_cache(self):
+        class DictCache(object):
+            def __init__(self):
+                self.entries = {}
+
+            def get(self, key):
+                return self.entries.get(key)
+
+            def set(self, key, entry, ttl):
+                self.entries[key] = entry
+
+        cache = DictCache()
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               cache=cache)
+        title_id = self.server.title_id(3)
+        title = netflix.get_title(title_id)
+        requests_made = self.server.request_count
+        self.assertEqual(netflix.get_title(title_id), title)
+        self.assertEqual(self.server.request_count, requests_made)
+        self.assertEqual(len(cache.entries), 1)
+
+    def test_user_functions(self):
+        self.assertEqual(self.user.get_details()['user']['user_id'], self.user.id)
+        intruder = self.netflix.get_user(self.user.id, 'access_token', 'access_token_secret')
+        self.assertRaises(NetflixError, intruder.get_details)
+
+        ratings = self.user.get_rating([self.server.title_id(1), self.server.title_id(2)])
+        self.assertEqual(len(ratings['ratings']['ratings_item']), 2)
+        # Split in batches of MAX_TITLE_REFS, the last one has a single rating
+        title_ids = [self.server.title_id(n) for n in reversed(range(MAX_TITLE_REFS * 2 + 1))]
+        requests_made = self.server.request_count
+        ratings = self.user.get_rating(title_ids)
+        self.assertEqual(self.server.request_count, requests_made + 3)
+        self.assertEqual([item['id'] for item in ratings['ratings']['ratings_item']], title_ids)
+        ratings = self.user.get_predicted_ratings(title_ids[MAX_TITLE_REFS - 1:])
+        self.assertEqual([item['id'] for item in ratings['ratings']['ratings_item']], title_ids[MAX_TITLE_REFS - 1:])
+        self.user.add_my_rating(self.server.title_id(5), 4)
+        self.user.update_my_rating('70000005', 2)
+        rating = self.user.get_my_rating('70000005')['ratings']['ratings_item'][0]
+        self.assertEqual(rating['user_rating'], 2)
+
+    def test_user_queues(self):
+        queue = self.user.get_queues_instant(max_results=10)['queue']
+        added = self.user.add_queue_instant(self.server.title_id(200), 1, queue['etag'])
+        self.assertNotEqual(added['status']['etag'], queue['etag'])
+        # The queue changed since its etag was read
+        self.assertRaises(NetflixError, self.user.add_queue_instant, self.server.title_id(201), 1, queue['etag'])
+        items = list(self.user.iter_queues_instant())
+        self.assertEqual(items[0]['link'][0]['href'], self.server.title_id(200))
+        available = list(self.user.iter_queues_instant_available(prefetch=True))
+        self.assertEqual([item['id'] for item in available], [item['id'] for item in items])
+        self.assertEqual(list(self.user.iter_queues_instant_saved()), [])
+
+    def test_download_catalog(self):
+        self.assertEqual(sum(1 for _ in self.netflix.get_catalog(parse=True)), 300)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'catalog.gz')
+            self.server.inject_fault(None, path='/catalog/titles/full', truncate=1000)
+            self.netflix.download_catalog(path)
+            with open(path, 'rb') as f:
+                self.assertEqual(sum(1 for _ in iter_titles(f)), 300)
+            self.assertFalse(self.netflix.sync_catalog(path))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_resume_catalog_after_server_errors(self):
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               retry=RetryPolicy(backoff_factor=0.01))
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'catalog.gz')
+            self.server.inject_fault(None, path='/catalog/titles/full', truncate=1000)
+            self.server.inject_fault(503, path='/catalog/titles/full', count=2)
+            self.assertRaises(NetflixError, netflix.download_catalog, path, max_retries=2)
+            # The part downloaded before the errors is kept, and resumed from
+            self.assertEqual(os.path.getsize(path + '.part'), 1000)
+            requests_made = self.server.request_count
+            self.server.inject_fault(502, path='/catalog/titles/full')
+            netflix.download_catalog(path, max_retries=2)
+            self.assertEqual(self.server.request_count, requests_made + 2)
+            with open(path, 'rb') as f:
+                self.assertEqual(sum(1 for _ in iter_titles(f)), 300)
+            self.assertEqual(sorted(os.listdir(directory)), ['catalog.gz', 'catalog.gz.json'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_faults(self):
+        title_id = self.server.title_id(3)
+        self.server.inject_fault(403, headers={'X-Mashery-Error-Code': 'ERR_403_DEVELOPER_OVER_QPS'})
+        self.assertRaises(RateLimitError, self.netflix.get_title, title_id)
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               retry=RetryPolicy(backoff_factor=0.01))
+        self.server.inject_fault(503, count=2)
+        self.assertEqual(netflix.get_title(title_id)['catalog_title']['id'], title_id)
+        self.server.inject_fault(drop=True)
+        self.assertEqual(netflix.get_title(title_id)['catalog_title']['id'], title_id)
+        user = netflix.get_user(self.user.id, self.user._access_token, self.user._access_token_secret)
+        self.server.inject_fault(503)
+        requests_made = self.server.request_count
+        self.assertRaises(NetflixError, user.add_my_rating, title_id, 4)
+        self.assertEqual(self.server.request_count, requests_made + 1)
+
+        breaker = CircuitBreaker(min_calls=3)
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               circuit_breaker=breaker)
+        netflix.get_request_token()
+        self.assertEqual(breaker.stats['oauth']['calls'], 1)
+        self.server.inject_fault(drop=True, path='/oauth/', count=2)
+        for _ in range(2):
+            self.assertRaises(requests.exceptions.ConnectionError, netflix.get_request_token)
+        self.assertEqual(breaker.state('oauth'), 'open')
+        self.assertRaises(CircuitOpenError, netflix.get_request_token)
+
+        # Requests timing out on the deadline of the caller don't count as failures of netflix
+        breaker = CircuitBreaker(min_calls=1)
+        netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                               circuit_breaker=breaker)
+        self.server.inject_fault(None, delay=0.3)
+        with netflix.deadline(0.1):
+            self.assertRaises(DeadlineExceededError, netflix.get_title, title_id)
+        self.assertEqual(breaker.stats['catalog'], {'state': 'closed', 'calls': 0, 'failures': 0, 'slow': 0})
+        self.assertEqual(netflix.get_title(title_id)['catalog_title']['id'], title_id)
+
+    def test_batch_errors(self):
+        ids = [self.server.title_id(n) for n in range(6)]
+        self.server.inject_fault(drop=True, count=None, path='movies/%s[?]' % ids[3].rpartition('/')[2])
+        titles = self.netflix.get_titles(ids + [self.server.title_id(1000)])
+        self.assertEqual([title['catalog_title']['id'] for title in titles[:3] + titles[4:6]], ids[:3] + ids[4:])
+        self.assertIsInstance(titles[3], requests.exceptions.ConnectionError)
+        self.assertIsInstance(titles[6], NetflixError)
+
+        # A malformed response only fails its own title
+        self.server.clear_faults()
+        self.server.inject_fault(None, path='movies/%s[?]' % ids[2].rpartition('/')[2], truncate=20)
+        titles = self.netflix.get_titles(ids)
+        self.assertIsInstance(titles[2], ValueError)
+        self.assertEqual([title['catalog_title']['id'] for title in titles[:2] + titles[3:]], ids[:2] + ids[3:])
+
+    def test_async_client(self):
+        with AsyncNetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret',
+                               base_url=self.server.base_url) as netflix:
+            pending = [netflix.get_title(self.server.title_id(n)) for n in range(5)]
+            for n, result in enumerate(pending):
+                self.assertEqual(result.get(5)['catalog_title']['id'], self.server.title_id(n))
+            self.assertRaises(NetflixError, netflix.get_title(self.server.title_id(1000)).get, 5)
+            # Generators run on the calling thread, they make their requests as they are iterated
+            titles = netflix.search_titles('matrix').get(5)
+            self.assertEqual(len(list(netflix.iter_search_titles('matrix'))), titles['number_of_results'])
+
+            user = netflix.get_user(self.user.id, self.user._access_token, self.user._access_token_secret)
+            self.assertEqual(user.get_details().get(5)['user']['user_id'], self.user.id)
+            queue = user.get_queues_instant().get(5)['queue']
+            self.assertEqual(len(list(user.iter_queues_instant())), queue['number_of_results'])
+            self.assertEqual(user.id, self.user.id)
+
+    def test_async_deadline(self):
+        with AsyncNetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret',
+                               base_url=self.server.base_url) as netflix:
+            self.server.inject_fault(None, delay=0.5)
+            with netflix.deadline(0.2):
+                pending = netflix.get_title(self.server.title_id(1))
+            self.assertRaises(DeadlineExceededError, pending.get, 5)
+
+    def test_record_replay(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'traffic.jsonl')
+            transport = RecordingTransport(path)
+            netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                                   transport=transport)
+            user = netflix.get_user(self.user.id, self.user._access_token, self.user._access_token_secret)
+            recorded = [netflix.search_titles('matrix'), user.get_queues_instant(), list(netflix.get_catalog(parse=True))]
+            transport.close()
+            with open(path) as f:
+                self.assertNotIn('oauth_nonce', f.read())
+
+            self.server.stop()
+            transport = ReplayTransport(path)
+            netflix = NetflixAPIV2('pyflix2-test', 'consumer_key', 'consumer_secret', base_url=self.server.base_url,
+                                   transport=transport)
+            user = netflix.get_user(self.user.id, 'access_token', 'access_token_secret')
+            replayed = [netflix.search_titles('matrix'), user.get_queues_instant(), list(netflix.get_catalog(parse=True))]
+            self.assertEqual(replayed, recorded)
+            self.assertRaises(ReplayMissError, user.get_details)
+        finally:
+            shutil.rmtree(directory)
+
+
 def dump_object(obj):
     if DUMP_OBJECTS:
         pprint.pprint(obj)
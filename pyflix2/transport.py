@@ -0,0 +1,208 @@
+""" Transports recording the traffic of a client to a file and replaying it without network access,
+to investigate the performance of the client (and of the code using it) on real, reproducible traffic::
+
+    netflix = NetflixAPIV2('appname', 'key', 'shared_secret', transport=RecordingTransport('traffic.jsonl'))
+    ...
+    netflix = NetflixAPIV2('appname', 'key', 'shared_secret', transport=ReplayTransport('traffic.jsonl'))
+
+The transports are ``requests`` adapters, mounted on the session of the client by the ``transport``
+option. They sit below the cache, retries and circuit breaker of the client, so every request actually
+sent (retries included) is recorded, and replayed.
+"""
+
+import time
+import zlib
+import base64
+import json
+import socket
+import threading
+from collections import deque
+from cStringIO import StringIO
+from urllib import urlencode
+from urlparse import urlsplit, urlunsplit, parse_qsl
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.response import HTTPResponse
+from requests.packages.urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+from pyflix2 import ReplayMissError
+
+ORIGINAL = 'original'
+""" Replay timing: every response is returned at the same offset from the first one as when it was recorded"""
+ZERO = 'zero'
+""" Replay timing: the responses are returned right away"""
+
+# The OAuth parameters changing with every request, they are left out of the recording
+SCRUBBED_PARAMS = ('oauth_nonce', 'oauth_signature', 'oauth_timestamp')
+# Request headers left out of the recording, they carry the credentials
+_SCRUBBED_HEADERS = ('authorization', 'cookie')
+
+
+def _scrub_query(query, drop):
+    return urlencode([(key, value) for key, value in parse_qsl(query, keep_blank_values=True) if not drop(key)])
+
+
+def scrub_url(url):
+    """ Returns ``url`` without the OAuth nonce, signature and timestamp"""
+    parts = urlsplit(url)
+    return urlunsplit(parts[:3] + (_scrub_query(parts.query, lambda key: key in SCRUBBED_PARAMS), parts.fragment))
+
+
+def request_key(method, url, body):
+    """ Returns the key a request is matched on when replaying: the method, the url and the body
+    without any OAuth parameter, the parameters being sorted"""
+    is_oauth = lambda key: key.startswith('oauth_')
+    parts = urlsplit(url)
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    body = sorted(parse_qsl(body or '', keep_blank_values=True))
+    return '%s %s?%s %s' % (method.upper(), urlunsplit(parts[:3] + ('', '')),
+                            urlencode([(k, v) for k, v in query if not is_oauth(k)]),
+                            urlencode([(k, v) for k, v in body if not is_oauth(k)]))
+
+
+def _encode_body(content):
+    return base64.b64encode(zlib.compress(content)) if content else ''
+
+
+def _decode_body(content):
+    return zlib.decompress(base64.b64decode(content)) if content else ''
+
+
+def _request_body(request):
+    body = request.body or ''
+    if not isinstance(body, basestring):
+        # Streamed uploads aren't recorded, the client never makes any
+        return ''
+    return body.encode('utf-8') if isinstance(body, unicode) else body
+
+
+def _build_response(adapter, request, record, stream):
+    """ Returns the ``requests.Response`` to ``request`` made of the recorded response ``record``"""
+    raw = HTTPResponse(body=StringIO(_decode_body(record['content'])), headers=record['response_headers'],
+                       status=record['status'], reason=record['reason'], preload_content=False, decode_content=True)
+    response = adapter.build_response(request, raw)
+    if not stream:
+        response.content
+    return response
+
+
+class RecordingTransport(HTTPAdapter):
+    """ Sends the requests over the network like the default transport and appends every request and
+    its response to ``path``, one compact json line each::
+
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', transport=RecordingTransport('traffic.jsonl'))
+
+    The OAuth nonce, signature and timestamp are removed from the recorded urls and the
+    ``Authorization`` header isn't recorded, the responses of the oauth token requests are recorded
+    though (they hold the tokens and their secrets). Response bodies are stored zlib compressed as sent
+    by netflix. Streamed responses (the catalog) are read completely before being returned, so
+    recording a catalog download holds it in memory. A transport can be shared by several clients,
+    it is thread safe.
+    """
+
+    def __init__(self, path, **adapter_options):
+        """
+        :param path: The file the traffic is appended to
+        :param adapter_options: (Optional) Options of ``requests.adapters.HTTPAdapter``, such as
+            ``pool_maxsize``, as the pool options of the client don't apply to a custom transport
+        """
+        super(RecordingTransport, self).__init__(**adapter_options)
+        self.path = path
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        started = time.time()
+        response = super(RecordingTransport, self).send(request, stream=True, timeout=timeout, verify=verify,
+                                                        cert=cert, proxies=proxies)
+        try:
+            content = response.raw.read(decode_content=False)
+        except ReadTimeoutError as e:
+            raise requests.exceptions.ReadTimeout(e, request=request)
+        except (ProtocolError, socket.error) as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+        finally:
+            response.close()
+        body = _request_body(request)
+        record = {'t': started,
+                  'elapsed': time.time() - started,
+                  'method': request.method,
+                  'url': scrub_url(request.url),
+                  'headers': dict((name, value) for name, value in request.headers.items()
+                                  if name.lower() not in _SCRUBBED_HEADERS),
+                  'body': _scrub_query(body, lambda key: key in SCRUBBED_PARAMS) if body else '',
+                  'status': response.status_code,
+                  'reason': response.reason,
+                  'response_headers': dict(response.headers),
+                  'content': _encode_body(content)}
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+        return _build_response(self, request, record, stream)
+
+    def close(self):
+        """ Closes the recording and the pooled connections"""
+        super(RecordingTransport, self).close()
+        with self._lock:
+            self._file.close()
+
+
+class ReplayTransport(HTTPAdapter):
+    """ Answers the requests with the responses recorded by :py:class:`RecordingTransport`, without any
+    network access::
+
+        netflix = NetflixAPIV2('appname', 'key', 'shared_secret', transport=ReplayTransport('traffic.jsonl'))
+
+    Requests are matched on their method, url and body, OAuth parameters aside. The responses recorded
+    for the same request are returned in the order they were recorded, the last one being repeated once
+    they are used up. A request which wasn't recorded fails with :py:class:`~pyflix2.ReplayMissError`.
+
+    With the ``"original"`` timing a response isn't returned before the offset from the start of the
+    replay at which it was received while recording, so the replay keeps the pace (and the
+    inter-arrival times) of the recorded traffic. With the ``"zero"`` timing responses are returned
+    at once, to replay at full speed.
+    """
+
+    def __init__(self, path, timing=ZERO):
+        """
+        :param path: The file recorded by :py:class:`RecordingTransport`
+        :param timing: (Optional) :py:data:`ZERO` or :py:data:`ORIGINAL`
+        """
+        if timing not in (ZERO, ORIGINAL):
+            raise ValueError("Invalid timing: %s" % timing)
+        super(ReplayTransport, self).__init__()
+        self.timing = timing
+        self._responses = {}
+        self._first = None
+        self._started = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                key = request_key(record['method'], record['url'], record['body'])
+                self._responses.setdefault(key, deque()).append(record)
+                if self._first is None or record['t'] < self._first:
+                    self._first = record['t']
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = request_key(request.method, request.url, _request_body(request))
+        with self._lock:
+            if self._started is None:
+                self._started = time.time()
+            responses = self._responses.get(key)
+            if not responses:
+                self.misses += 1
+                raise ReplayMissError("No recorded response for: %s" % key)
+            self.hits += 1
+            record = responses.popleft() if len(responses) > 1 else responses[0]
+        if self.timing == ORIGINAL:
+            wait = self._started + record['t'] + record['elapsed'] - self._first - time.time()
+            if wait > 0:
+                time.sleep(wait)
+        return _build_response(self, request, record, stream)